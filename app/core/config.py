@@ -1,19 +1,111 @@
 
 from pydantic import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     APP_NAME: str = "PAY CREST API"
     API_PREFIX: str = "/api"
     MONGODB_URI: str = "mongodb://localhost:27017"
     MONGODB_DB: str = "pay_crest"
+    # group ledger, loan and transaction writes in a multi-document transaction (needs a replica set)
+    MONGODB_TRANSACTIONS: bool = False
 
     JWT_SECRET: str = "CHANGE_ME"
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRE_MINUTES: int = 60 * 24
+    # authenticated users cached per process; a change made in another worker is seen within the TTL
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10_000
+
+    # bcrypt runs on a dedicated thread pool; requests beyond pool size + queue get 503
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_POOL_SIZE: int = 4
+    BCRYPT_MAX_QUEUE: int = 64
 
     DEFAULT_IFSC: str = "PCIN0000"
 
+    # loan_id -> collection entries kept by services/loan_repository.py
+    LOAN_REGISTRY_MAX_ENTRIES: int = 100_000
+
+    # keyset-paginated list endpoints
+    PAGE_SIZE_DEFAULT: int = 50
+    PAGE_SIZE_MAX: int = 200
+
+    # rows per cursor batch / response chunk for streamed statement exports
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # how often each worker checks system_settings for a newer version
+    SETTINGS_POLL_SECONDS: float = 5
+
+    # ids reserved per counter round trip (see utils/sequences.py); per-sequence overrides as JSON
+    SEQUENCE_BLOCK_SIZE: int = 20
+    SEQUENCE_BLOCK_SIZES: Dict[str, int] = {"transaction_id": 200}
+
+    # EMI penalty scan: loans per cursor batch / bulk_write, and batches flushed concurrently
+    PENALTY_SCAN_BATCH_SIZE: int = 500
+    PENALTY_SCAN_CONCURRENCY: int = 4
+    # EMI auto-debit batch: due loans per cursor batch / bulk_write
+    EMI_AUTO_DEBIT_BATCH_SIZE: int = 500
+
+    # document uploads are streamed to disk in chunks; larger files are rejected with 413, from
+    # the Content-Length header when there is one (core/upload_limit.py)
+    UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 256 * 1024
+    # content-addressed blob store: gzip blobs when that saves at least (1 - ratio) of the size,
+    # and keep unreferenced blobs this long before a sweep may delete them
+    DOCUMENT_COMPRESSION: bool = False
+    DOCUMENT_COMPRESSION_MAX_RATIO: float = 0.9
+    DOCUMENT_BLOB_GRACE_SECONDS: int = 3600
+    # resolved download paths per stored document reference (a re-upload stores a new one)
+    DOCUMENT_CACHE_TTL_SECONDS: float = 60
+    DOCUMENT_CACHE_MAX_ENTRIES: int = 10_000
+    # uploaded PDFs are checked in a process pool; results are cached per content hash
+    PDF_MAX_PAGES: int = 50
+    PDF_VALIDATION_WORKERS: int = 2
+    PDF_VALIDATION_TIMEOUT_SECONDS: float = 10
+    PDF_VALIDATION_CACHE_TTL_SECONDS: float = 24 * 3600
+    PDF_VALIDATION_CACHE_MAX_ENTRIES: int = 10_000
+    # a file whose check timed out is rejected without another attempt for this long
+    PDF_VALIDATION_TIMEOUT_CACHE_SECONDS: float = 600
+
+    # per-route latency and Mongo command metrics, served in Prometheus format at /metrics
+    METRICS_ENABLED: bool = True
+    # slow-query log and N+1 detection (core/diagnostics.py); defaults for the `diagnostics`
+    # entry admins change at runtime through PUT /admin/diagnostics
+    DIAGNOSTICS_ENABLED: bool = False
+    DIAGNOSTICS_SLOW_COMMAND_MS: float = 100
+    DIAGNOSTICS_MAX_COMMANDS_PER_REQUEST: int = 25
+    DIAGNOSTICS_REPEATED_SHAPE_THRESHOLD: int = 5
+    # distinct query shapes tracked per worker, and how many of the slowest get explained how often
+    DIAGNOSTICS_MAX_SHAPES: int = 1000
+    DIAGNOSTICS_EXPLAIN_TOP: int = 5
+    DIAGNOSTICS_EXPLAIN_INTERVAL_SECONDS: float = 60
+    # local tracing (core/tracing.py): full span trees for a sampled share of requests plus the
+    # root span of every other slow one, in a ring of TRACE_BUFFER_SIZE traces per worker and,
+    # when TRACE_FILE is set, appended to it as JSONL
+    TRACING_ENABLED: bool = True
+    TRACE_SAMPLE_RATE: float = 0.01
+    TRACE_SLOW_MS: float = 500
+    TRACE_BUFFER_SIZE: int = 1000
+    TRACE_MAX_SPANS: int = 500
+    TRACE_FILE: Optional[str] = None
+    # request profiling (core/profiling.py), off unless enabled: stack sampling interval, default
+    # 1-in-N per-route sampling (0 = only requests an admin asks for), and profiles kept per worker
+    PROFILING_ENABLED: bool = False
+    PROFILE_INTERVAL_MS: float = 5
+    PROFILE_SAMPLE_EVERY: int = 0
+    PROFILE_MAX_CONCURRENT: int = 4
+    PROFILE_BUFFER_SIZE: int = 200
+    # event loop monitor (core/loop_monitor.py), off unless enabled: lag probe period, percentile
+    # window, how long the loop may be stuck before its stack is captured, and strict mode (a
+    # request that blocked the loop gets a 500; for tests and staging)
+    LOOP_MONITOR_ENABLED: bool = False
+    LOOP_LAG_INTERVAL_MS: float = 100
+    LOOP_LAG_WINDOW: int = 600
+    LOOP_BLOCK_THRESHOLD_MS: float = 200
+    LOOP_BLOCK_STACK_DEPTH: int = 30
+    LOOP_STRICT: bool = False
+
     class Config:
         env_file = ".env"
         case_sensitive = True
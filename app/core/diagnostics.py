@@ -0,0 +1,234 @@
+"""Slow-query log and N+1 detection, switchable at runtime.
+
+The `diagnostics` entry of system_settings (set through `PUT /admin/diagnostics`) is applied by
+`configure` whenever a worker loads the settings snapshot, so turning it on reaches every worker
+within SETTINGS_POLL_SECONDS and needs no restart. While enabled:
+
+- every Mongo command slower than `slow_command_ms` is logged with its query shape (the filter
+  and sort with values replaced by "?") and the route that issued it;
+- per-shape counts and timings are kept so `services/diagnostics_service.py` can explain the
+  slowest shapes;
+- a request that sends more than `max_commands_per_request` commands, or the same shape
+  `repeated_shape_threshold` times or more (a query inside a loop), is logged and kept in
+  `flagged_requests`.
+
+Everything is per worker process. When disabled the listener only checks one flag.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from pymongo import monitoring
+from .config import settings
+from .metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+# commands that say nothing about query patterns (cursor paging, sessions, our own explains)
+IGNORED_COMMANDS = {"getMore", "killCursors", "endSessions", "explain", "hello", "isMaster", "ping"}
+# commands `explain` accepts
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+# command fields that belong to the session/connection, not the query
+_SESSION_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "$db", "$clusterTime", "$readPreference", "signature"}
+
+
+def _defaults() -> dict:
+    return {
+        "enabled": settings.DIAGNOSTICS_ENABLED,
+        "slow_command_ms": settings.DIAGNOSTICS_SLOW_COMMAND_MS,
+        "max_commands_per_request": settings.DIAGNOSTICS_MAX_COMMANDS_PER_REQUEST,
+        "repeated_shape_threshold": settings.DIAGNOSTICS_REPEATED_SHAPE_THRESHOLD,
+    }
+
+
+config: dict = _defaults()
+
+
+def configure(doc: dict | None):
+    """Apply the `diagnostics` entry of a settings snapshot; unset fields keep their defaults."""
+    global config
+    new = {**_defaults(), **{k: v for k, v in (doc or {}).items() if v is not None}}
+    if new != config:
+        logger.info("diagnostics %s: %s", "enabled" if new["enabled"] else "disabled", new)
+    config = new
+
+
+def query_shape(value):
+    """The structure of a filter/sort with every value replaced by "?"."""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        return [query_shape(v) for v in value]
+    return "?"
+
+
+def command_shape(name: str, command) -> dict:
+    if name == "aggregate":
+        return {"pipeline": [
+            {"$match": query_shape(stage["$match"])} if "$match" in stage else next(iter(stage), "?")
+            for stage in command.get("pipeline", [])
+        ]}
+    if name in ("update", "delete"):
+        ops = command.get(f"{name}s") or [{}]
+        return {"filter": query_shape(ops[0].get("q", {})), "ops": len(ops)}
+    shape = {"filter": query_shape(command.get("filter", command.get("query", {})))}
+    if command.get("sort"):
+        shape["sort"] = dict(command["sort"])
+    return shape
+
+
+def _explainable(name: str, command) -> dict | None:
+    """The command stripped of session fields, with a single update/delete op, ready for `explain`."""
+    if name not in EXPLAINABLE:
+        return None
+    sample = {k: v for k, v in command.items() if k not in _SESSION_FIELDS}
+    if name in ("update", "delete"):
+        sample[f"{name}s"] = sample.get(f"{name}s", [])[:1]
+    return sample
+
+
+class ShapeStats:
+    __slots__ = ("command", "collection", "shape", "count", "total_ms", "max_ms", "sample", "explain")
+
+    def __init__(self, command: str, collection: str, shape: dict, sample: dict | None):
+        self.command, self.collection, self.shape, self.sample = command, collection, shape, sample
+        self.count, self.total_ms, self.max_ms = 0, 0.0, 0.0
+        self.explain: dict | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "command": self.command,
+            "collection": self.collection,
+            "shape": self.shape,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "explain": self.explain,
+        }
+
+
+_lock = threading.Lock()
+shapes: dict[str, ShapeStats] = {}
+flagged_requests: deque = deque(maxlen=100)
+# (connection, request id) -> (shape key, ShapeStats) between a command's start and its reply
+_pending: dict = {}
+
+
+class RequestDiagnostics:
+    __slots__ = ("scope", "commands", "shapes")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.commands = 0
+        self.shapes: Counter = Counter()
+
+
+_request: ContextVar[RequestDiagnostics | None] = ContextVar("request_diagnostics", default=None)
+
+
+class DiagnosticsListener(monitoring.CommandListener):
+    def started(self, event):
+        if not config["enabled"] or event.command_name in IGNORED_COMMANDS:
+            return
+        name, command = event.command_name, event.command
+        collection = str(command.get(name, ""))
+        shape = command_shape(name, command)
+        key = f"{name} {collection} {json.dumps(shape, default=str)}"
+        with _lock:
+            stats = shapes.get(key)
+            if stats is None and len(shapes) < settings.DIAGNOSTICS_MAX_SHAPES:
+                stats = shapes[key] = ShapeStats(name, collection, shape, _explainable(name, command))
+        _pending[(event.connection_id, event.request_id)] = (key, stats)
+        ctx = _request.get()
+        if ctx is not None:
+            ctx.commands += 1
+            ctx.shapes[key] += 1
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        pending = _pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        key, stats = pending
+        ms = event.duration_micros / 1000
+        if stats is not None:
+            with _lock:
+                stats.count += 1
+                stats.total_ms += ms
+                stats.max_ms = max(stats.max_ms, ms)
+        if ms >= config["slow_command_ms"]:
+            ctx = _request.get()
+            route = route_template(ctx.scope) if ctx else "background"
+            logger.warning("slow mongo command %.1f ms route=%s %s", ms, route, key)
+
+
+class DiagnosticsMiddleware:
+    """Counts the commands and shapes each request sends and flags the N+1 ones."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config["enabled"]:
+            await self.app(scope, receive, send)
+            return
+        ctx = RequestDiagnostics(scope)
+        token = _request.set(ctx)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request.reset(token)
+            _check_request(ctx, (time.perf_counter() - started) * 1000)
+
+
+def _check_request(ctx: RequestDiagnostics, elapsed_ms: float):
+    repeated = {key: n for key, n in ctx.shapes.items() if n >= config["repeated_shape_threshold"]}
+    too_many = ctx.commands > config["max_commands_per_request"]
+    if not (repeated or too_many):
+        return
+    entry = {
+        "at": datetime.utcnow(),
+        "method": ctx.scope["method"],
+        "route": route_template(ctx.scope),
+        "path": ctx.scope["path"],
+        "elapsed_ms": round(elapsed_ms, 2),
+        "commands": ctx.commands,
+        "repeated_shapes": repeated,
+    }
+    flagged_requests.append(entry)
+    logger.warning(
+        "possible N+1: %s %s sent %d mongo commands in %.1f ms; repeated shapes: %s",
+        entry["method"], entry["route"], ctx.commands, elapsed_ms, repeated or "none",
+    )
+
+
+def slowest_shapes(limit: int) -> list[ShapeStats]:
+    with _lock:
+        return sorted(shapes.values(), key=lambda s: s.max_ms, reverse=True)[:limit]
+
+
+def report(limit: int = 20) -> dict:
+    with _lock:
+        by_total = sorted(shapes.values(), key=lambda s: s.total_ms, reverse=True)[:limit]
+        return {
+            "config": config,
+            "shapes_tracked": len(shapes),
+            "shapes": [s.as_dict() for s in by_total],
+            "flagged_requests": list(flagged_requests),
+        }
+
+
+def reset():
+    with _lock:
+        shapes.clear()
+        flagged_requests.clear()
@@ -0,0 +1,183 @@
+"""Event loop lag and blocking-call detection.
+
+`probe_loop_lag` runs on the loop: it sleeps LOOP_LAG_INTERVAL_MS and records how late it woke
+up (the `event_loop_lag_seconds` histogram, plus p50/p95/p99 over the last LOOP_LAG_WINDOW
+probes as `event_loop_lag_*` gauges). Each wake-up is also a heartbeat for a watchdog thread;
+when the heartbeat is more than LOOP_BLOCK_THRESHOLD_MS overdue, the loop is stuck in
+synchronous code, and the watchdog captures the loop thread's stack while it is still there,
+together with the route of the request whose task was running. Tasks a request spawns (gather,
+create_task) are tracked by a task factory, as the profiler does, so a stall in one of them is
+attributed to the request too.
+
+With LOOP_STRICT (meant for tests and staging), a request whose task blocked the loop gets a 500
+naming the blocking frame instead of its response, so a blocking call in a handler fails
+loudly.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from .config import settings
+from .metrics import LOOP_BLOCKS, LOOP_LAG, route_template
+from ..utils.responses import MongoJSONResponse
+
+logger = logging.getLogger(__name__)
+
+_lags: deque = deque(maxlen=settings.LOOP_LAG_WINDOW)
+_heartbeat = time.monotonic()
+_loop = None
+_loop_thread_id: int | None = None
+_watchdog_thread: threading.Thread | None = None
+# request task -> ASGI scope for requests in progress, so the watchdog can name the route
+_task_scopes: dict = {}
+# task spawned while handling a request -> that request's task
+_spawned: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_request_task: ContextVar[asyncio.Task | None] = ContextVar("loop_monitor_request", default=None)
+# task -> capture, for tasks that blocked the loop and have not answered yet (strict mode)
+_blocked_tasks: dict = {}
+blocks: deque = deque(maxlen=100)
+
+
+def _percentile(ordered: list, p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def lag_stats() -> dict:
+    ordered = sorted(_lags)
+    if not ordered:
+        return {"samples": 0}
+    return {
+        "samples": len(ordered),
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "blocks": len(blocks),
+    }
+
+
+async def probe_loop_lag():
+    global _heartbeat, _loop, _loop_thread_id, _watchdog_thread
+    _loop, _loop_thread_id = asyncio.get_running_loop(), threading.get_ident()
+    interval = settings.LOOP_LAG_INTERVAL_MS / 1000
+    if _watchdog_thread is None:
+        _watchdog_thread = threading.Thread(target=_watchdog, name="loop-watchdog", daemon=True)
+        _watchdog_thread.start()
+    while True:
+        started = time.perf_counter()
+        _heartbeat = time.monotonic()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - started - interval)
+        _lags.append(lag)
+        LOOP_LAG.observe((), lag)
+
+
+def _capture(overdue: float):
+    frame = sys._current_frames().get(_loop_thread_id)
+    if frame is None:
+        return
+    task = asyncio.current_task(_loop)
+    owner = _spawned.get(task, task) if task is not None else None
+    scope = _task_scopes.get(owner)
+    route = route_template(scope) if scope else "background"
+    stack = traceback.format_list(traceback.extract_stack(frame)[-settings.LOOP_BLOCK_STACK_DEPTH:])
+    record = {
+        "at": datetime.utcnow(),
+        "blocked_ms": round(overdue * 1000, 1),
+        "route": route,
+        "path": scope["path"] if scope else None,
+        "task": task.get_name() if task else None,
+        "stack": stack,
+    }
+    blocks.append(record)
+    LOOP_BLOCKS.inc((route,))
+    if scope is not None:
+        _blocked_tasks[owner] = record
+    logger.warning("event loop blocked for %.0f ms+ in %s:\n%s", overdue * 1000, route, "".join(stack))
+
+
+def _watchdog():
+    threshold = settings.LOOP_BLOCK_THRESHOLD_MS / 1000
+    interval = settings.LOOP_LAG_INTERVAL_MS / 1000
+    captured_beat = None
+    while True:
+        time.sleep(threshold / 2)
+        beat = _heartbeat
+        overdue = time.monotonic() - beat - interval
+        # one capture per stall: wait for the next heartbeat before capturing again
+        if overdue > threshold and beat != captured_beat:
+            captured_beat = beat
+            try:
+                _capture(overdue)
+            except Exception:
+                logger.exception("capturing the blocked event loop stack failed")
+
+
+def _task_factory(previous):
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        request_task = _request_task.get()
+        if request_task is not None:
+            _spawned[task] = request_task
+        return task
+    return factory
+
+
+def install_task_factory():
+    """Map tasks spawned by a request to the request's task, so their stalls are attributed to it."""
+    loop = asyncio.get_running_loop()
+    loop.set_task_factory(_task_factory(loop.get_task_factory()))
+
+
+class LoopMonitorMiddleware:
+    """Lets the watchdog attribute stalls to requests; in strict mode turns them into 500s."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        _task_scopes[task] = scope
+        token = _request_task.set(task)
+        if not settings.LOOP_STRICT:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _request_task.reset(token)
+                _task_scopes.pop(task, None)
+                _blocked_tasks.pop(task, None)
+            return
+
+        replaced = False
+
+        async def strict_send(message):
+            nonlocal replaced
+            record = _blocked_tasks.get(task)
+            if message["type"] == "http.response.start" and record is not None:
+                replaced = True
+                response = MongoJSONResponse(
+                    {"detail": f"Event loop blocked for {record['blocked_ms']} ms+ while handling this request", "stack": record["stack"]},
+                    status_code=500,
+                )
+                await response(scope, receive, send)
+                return
+            if not replaced:
+                await send(message)
+
+        try:
+            await self.app(scope, receive, strict_send)
+        finally:
+            _request_task.reset(token)
+            _task_scopes.pop(task, None)
+            record = _blocked_tasks.pop(task, None)
+        if record is not None and not replaced:
+            raise RuntimeError(f"event loop blocked for {record['blocked_ms']} ms+ after the response started: {scope['path']}")
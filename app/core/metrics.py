@@ -0,0 +1,217 @@
+"""Request and Mongo metrics in Prometheus text format.
+
+`MetricsMiddleware` times every HTTP request and keeps a `RequestContext` in a context
+variable for its duration. `MongoCommandListener` is passed to the Motor client, and Motor
+runs pymongo with the caller's context copied into its executor threads, so each command is
+attributed to the route template of the request that issued it (`background` outside
+requests). `render()` produces the `/metrics` page; figures are per process, so scrape every
+worker.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20, 50, 100)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_lock = threading.Lock()
+
+
+class CounterVec:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+
+class GaugeVec(CounterVec):
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+
+class HistogramVec:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help, labelnames, buckets
+        # labels -> [count per bucket (last is +Inf), sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        with _lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (("le", str(bound)),), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+HTTP_REQUESTS = CounterVec("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_LATENCY = HistogramVec("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = GaugeVec("http_requests_in_flight", "HTTP requests being handled")
+MONGO_COMMANDS = CounterVec("mongo_commands_total", "Mongo commands by issuing route", ("route", "command", "outcome"))
+MONGO_SECONDS = CounterVec("mongo_command_seconds_total", "Time spent in Mongo commands by issuing route", ("route", "command"))
+MONGO_LATENCY = HistogramVec("mongo_command_duration_seconds", "Mongo command latency", ("command",), MONGO_BUCKETS)
+MONGO_IN_FLIGHT = GaugeVec("mongo_commands_in_flight", "Mongo commands awaiting a reply")
+MONGO_PER_REQUEST = HistogramVec(
+    "mongo_commands_per_request", "Mongo commands issued by one request", ("method", "route"), COMMAND_COUNT_BUCKETS
+)
+LOOP_LAG = HistogramVec("event_loop_lag_seconds", "Delay of the event loop lag probe past its due time", (), LOOP_LAG_BUCKETS)
+LOOP_BLOCKS = CounterVec("event_loop_blocks_total", "Times the event loop was blocked past the threshold", ("route",))
+
+METRICS = [
+    HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT, MONGO_COMMANDS, MONGO_SECONDS, MONGO_LATENCY, MONGO_IN_FLIGHT, MONGO_PER_REQUEST,
+    LOOP_LAG, LOOP_BLOCKS,
+]
+
+# prefix -> function returning a flat dict of numbers, exported as gauges (cache and pool stats)
+_stats_sources: dict[str, Callable[[], dict]] = {}
+
+
+def register_stats(prefix: str, source: Callable[[], dict]):
+    _stats_sources[prefix] = source
+
+
+# endpoint function -> route template, filled on first sight of each endpoint
+_route_templates: dict = {}
+
+
+def route_template(scope) -> str:
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    template = _route_templates.get(endpoint)
+    if template is None:
+        template = next((r.path for r in scope["app"].routes if getattr(r, "endpoint", None) is endpoint), "unmatched")
+        _route_templates[endpoint] = template
+    return template
+
+
+class RequestContext:
+    """Per-request state shared with the Mongo listener; `commands` holds (command, seconds) pairs."""
+
+    __slots__ = ("scope", "commands")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.commands: list[tuple[str, float]] = []
+
+    @property
+    def route(self) -> str:
+        return route_template(self.scope)
+
+
+_request: ContextVar[RequestContext | None] = ContextVar("request_context", default=None)
+
+
+def current_request() -> RequestContext | None:
+    return _request.get()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: latency histogram, status counts and in-flight gauge per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        ctx = RequestContext(scope)
+        token = _request.set(ctx)
+        status = 500
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            route, method = ctx.route, scope["method"]
+            HTTP_REQUESTS.inc((method, route, str(status)))
+            HTTP_LATENCY.observe((method, route), elapsed)
+            MONGO_PER_REQUEST.observe((method, route), len(ctx.commands))
+            _request.reset(token)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Counts and times every command, attributed to the request that issued it."""
+
+    def started(self, event):
+        MONGO_IN_FLIGHT.inc()
+
+    def succeeded(self, event):
+        self._finished(event, "ok")
+
+    def failed(self, event):
+        self._finished(event, "error")
+
+    def _finished(self, event, outcome: str):
+        MONGO_IN_FLIGHT.dec()
+        seconds = event.duration_micros / 1e6
+        ctx = _request.get()
+        route = ctx.route if ctx else "background"
+        if ctx:
+            ctx.commands.append((event.command_name, seconds))
+        MONGO_COMMANDS.inc((route, event.command_name, outcome))
+        MONGO_SECONDS.inc((route, event.command_name), seconds)
+        MONGO_LATENCY.observe((event.command_name,), seconds)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _line(name: str, labelnames: tuple, labels: tuple, value) -> str:
+    pairs = [(n, v) for n, v in zip(labelnames, labels)] + [p for p in labels[len(labelnames):]]
+    label_str = ",".join(f'{n}="{_escape(v)}"' for n, v in pairs)
+    return f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}"
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        for metric in METRICS:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines += [_line(name, metric.labelnames, labels, value) for name, labels, value in metric.samples()]
+    for prefix, source in _stats_sources.items():
+        for key, value in source().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,278 @@
+"""On-demand sampling profiler for single requests.
+
+An admin request carrying `X-Profile: 1` (or `?profile=1`) is profiled, and so is one in every
+`sample_every` requests per route when the `profiling` entry of system_settings sets it (through
+`PUT /admin/profiling`, picked up by every worker on its next settings poll). Profiled responses
+carry `X-Profile-Id`; the profile is then served by `/admin/profiles/{id}` and, as folded stacks
+for flamegraph.pl or speedscope, by `/admin/profiles/{id}/folded`.
+
+A sampler thread wakes every PROFILE_INTERVAL_MS while a profile is active and looks at each
+task that belongs to the request: the request's own task plus every task created inside its
+context (tracked by a task factory). When such a task is running, the event loop thread's
+stack is recorded under `[cpu]`; when it is suspended, its await chain is recorded under
+`[wait]`. So CPU-bound Python (serialization, validation) and the awaits a request spends its
+time in (Mongo, the bcrypt pool) both show up, and other requests on the same loop do not.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from fastapi import HTTPException
+from starlette.routing import Match
+from .config import settings
+from .metrics import route_template
+from .security import get_current_user
+from ..models.enums import Roles
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) + os.sep
+
+
+def _defaults() -> dict:
+    return {"sample_every": settings.PROFILE_SAMPLE_EVERY}
+
+
+config: dict = _defaults()
+
+
+def configure(doc: dict | None):
+    """Apply the `profiling` entry of a settings snapshot; unset fields keep their defaults."""
+    global config
+    config = {**_defaults(), **{k: v for k, v in (doc or {}).items() if v is not None}}
+
+
+class Profile:
+    def __init__(self, trigger: str, scope, thread_id: int, loop):
+        self.id = os.urandom(8).hex()
+        self.trigger = trigger
+        self.scope = scope
+        self.thread_id = thread_id
+        self.loop = loop
+        self.tasks: list[asyncio.Task] = []
+        self.stacks: Counter = Counter()
+        self.cpu_samples = self.wait_samples = self.skipped_samples = 0
+        self.started_at = datetime.utcnow()
+        self._started = time.perf_counter()
+        self.record: dict | None = None
+
+    def finish(self, status: int) -> dict:
+        self.tasks = []
+        self.record = {
+            "profile_id": self.id,
+            "trigger": self.trigger,
+            "method": self.scope["method"],
+            "route": route_template(self.scope),
+            "path": self.scope["path"],
+            "status": status,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "interval_ms": settings.PROFILE_INTERVAL_MS,
+            "cpu_samples": self.cpu_samples,
+            "wait_samples": self.wait_samples,
+            "skipped_samples": self.skipped_samples,
+            "stacks": dict(self.stacks.most_common()),
+        }
+        return self.record
+
+
+_profile: ContextVar[Profile | None] = ContextVar("profile", default=None)
+_active: list[Profile] = []
+_wake = threading.Event()
+_sampler: threading.Thread | None = None
+profiles: deque = deque(maxlen=settings.PROFILE_BUFFER_SIZE)
+_route_counts: Counter = Counter()
+
+
+def _frame_name(frame) -> str:
+    filename = frame.f_code.co_filename
+    if "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(_ROOT):
+        filename = filename[len(_ROOT):]
+    else:
+        filename = os.path.basename(filename)
+    code = frame.f_code
+    # co_qualname (Class.method) is new in 3.11
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename})"
+
+
+def _thread_stack(frame) -> list:
+    """Innermost frame -> frames outermost first, without the event loop's own frames."""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    for i in range(len(frames) - 1, -1, -1):
+        # everything up to the loop handle that resumed the task is loop machinery
+        if frames[i].f_code.co_name == "_run" and frames[i].f_code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+            return frames[i + 1:]
+    return frames
+
+
+def _await_stack(coro) -> list:
+    """Frames of a suspended coroutine and everything it is awaiting, outermost first."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+def _sample_profile(profile: Profile, frames: dict):
+    current = asyncio.current_task(profile.loop)
+    for task in profile.tasks[:]:
+        if task.done():
+            continue
+        if task is current:
+            stack, root = _thread_stack(frames.get(profile.thread_id)), "[cpu]"
+            profile.cpu_samples += 1
+        else:
+            stack, root = _await_stack(task.get_coro()), "[wait]"
+            profile.wait_samples += 1
+        if stack:
+            profile.stacks[";".join([root, *map(_frame_name, stack)])] += 1
+
+
+def _sample():
+    frames = sys._current_frames()
+    for profile in _active[:]:
+        try:
+            _sample_profile(profile, frames)
+        except (RuntimeError, AttributeError):
+            # the loop's task registry changed, or a coroutine finished, while it was being walked
+            profile.skipped_samples += 1
+
+
+def _run_sampler():
+    while True:
+        _wake.wait()
+        while _active:
+            _sample()
+            time.sleep(settings.PROFILE_INTERVAL_MS / 1000)
+        _wake.clear()
+        if _active:
+            _wake.set()
+
+
+def _start(profile: Profile):
+    global _sampler
+    _active.append(profile)
+    if _sampler is None:
+        _sampler = threading.Thread(target=_run_sampler, name="request-profiler", daemon=True)
+        _sampler.start()
+    _wake.set()
+
+
+def _task_factory(previous):
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        profile = _profile.get()
+        if profile is not None:
+            profile.tasks.append(task)
+        return task
+    return factory
+
+
+def install_task_factory():
+    """Track tasks spawned by a profiled request (gather, create_task) so their samples count."""
+    loop = asyncio.get_running_loop()
+    loop.set_task_factory(_task_factory(loop.get_task_factory()))
+
+
+def _requested(scope) -> bool:
+    if any(name == b"x-profile" and value not in (b"", b"0") for name, value in scope["headers"]):
+        return True
+    return any(part in (b"profile=1", b"profile=true") for part in scope.get("query_string", b"").split(b"&"))
+
+
+async def _is_admin(scope) -> bool:
+    auth = next((value for name, value in scope["headers"] if name == b"authorization"), b"").decode("latin-1")
+    scheme, _, token = auth.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        user = await get_current_user(token)
+    except HTTPException:
+        return False
+    return user.get("role") == Roles.ADMIN
+
+
+def _matched_route(scope) -> str:
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def _sampled(scope) -> bool:
+    every = config["sample_every"]
+    if not every:
+        return False
+    key = (scope["method"], _matched_route(scope))
+    _route_counts[key] += 1
+    return _route_counts[key] % every == 0
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = None
+        if _requested(scope) and await _is_admin(scope):
+            trigger = "requested"
+        elif _sampled(scope):
+            trigger = "sampled"
+        if trigger is None or len(_active) >= settings.PROFILE_MAX_CONCURRENT:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(trigger, scope, threading.get_ident(), asyncio.get_running_loop())
+        profile.tasks.append(asyncio.current_task())
+        token = _profile.set(profile)
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        _start(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _active.remove(profile)
+            _profile.reset(token)
+            profiles.append(profile.finish(status))
+
+
+def _summary(record: dict) -> dict:
+    return {k: v for k, v in record.items() if k != "stacks"}
+
+
+def find_profiles(route: str | None = None, limit: int = 50) -> list[dict]:
+    """Newest first; `route` matches a substring of the route template."""
+    found = [_summary(r) for r in reversed(profiles) if route is None or route in r["route"]]
+    return found[:limit]
+
+
+def get_profile(profile_id: str) -> dict | None:
+    return next((record for record in profiles if record["profile_id"] == profile_id), None)
+
+
+def folded(record: dict) -> str:
+    """Brendan Gregg's folded-stack format: `frame;frame;frame count` per line."""
+    return "".join(f"{stack} {count}\n" for stack, count in record["stacks"].items())
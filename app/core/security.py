@@ -1,5 +1,8 @@
 
+import asyncio
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 import bcrypt
@@ -10,22 +13,90 @@ from ..core.config import settings
 from ..database.mongo import get_db
 from bson import ObjectId
 from ..utils.id import to_object_id
+from ..utils.cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_PREFIX}/auth/login")
 
+# user id (as in the token) -> user document, so most requests authorize without a db call
+principal_cache = TTLCache(settings.PRINCIPAL_CACHE_MAX_ENTRIES, settings.PRINCIPAL_CACHE_TTL_SECONDS)
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+
+def invalidate_principal(user_id):
+    """Drop a cached user; call after changing its is_active, role or is_kyc_verified."""
+    principal_cache.invalidate(str(user_id))
+
+
+# bcrypt releases the GIL, so a thread pool gives real parallelism and keeps the event loop free
+_hash_pool = ThreadPoolExecutor(max_workers=settings.BCRYPT_POOL_SIZE, thread_name_prefix="bcrypt")
+_hash_lock = threading.Lock()
+_hash_stats = {"in_flight": 0, "running": 0, "completed": 0, "rejected": 0, "busy_seconds": 0.0}
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    with _hash_lock:
+        _hash_stats["running"] += 1
+    try:
+        return fn(*args)
+    finally:
+        with _hash_lock:
+            _hash_stats["running"] -= 1
+            _hash_stats["completed"] += 1
+            _hash_stats["busy_seconds"] += time.perf_counter() - started
+
+
+async def _run_hashing(fn, *args):
+    if _hash_stats["in_flight"] >= settings.BCRYPT_POOL_SIZE + settings.BCRYPT_MAX_QUEUE:
+        _hash_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    _hash_stats["in_flight"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_pool, _timed, fn, *args)
+    finally:
+        _hash_stats["in_flight"] -= 1
+
+
+def hashing_pool_stats() -> dict:
+    running = _hash_stats["running"]
+    return {
+        **_hash_stats,
+        "busy_seconds": round(_hash_stats["busy_seconds"], 3),
+        "queued": max(0, _hash_stats["in_flight"] - running),
+        "pool_size": settings.BCRYPT_POOL_SIZE,
+        "max_queue": settings.BCRYPT_MAX_QUEUE,
+        "utilisation": round(running / settings.BCRYPT_POOL_SIZE, 3),
+        "rounds": settings.BCRYPT_ROUNDS,
+    }
+
+
+def _hash_password_sync(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode(), salt).decode()
 
 
-def verify_password(password: str, hashed: str) -> bool:
+def _verify_password_sync(password: str, hashed: str) -> bool:
     try:
         return bcrypt.checkpw(password.encode(), hashed.encode())
     except Exception:
         return False
 
 
+async def hash_password(password: str) -> str:
+    return await _run_hashing(_hash_password_sync, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run_hashing(_verify_password_sync, password, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True when a stored hash was made with a different cost than BCRYPT_ROUNDS."""
+    try:
+        return int(hashed.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
 def create_access_token(subject: dict, expires_minutes: int | None = None) -> str:
     expire = datetime.utcnow() + timedelta(minutes=expires_minutes or settings.JWT_EXPIRE_MINUTES)
     payload = {**subject, "exp": expire}
@@ -45,18 +116,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     role = payload.get("role")
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token payload")
-    db = await get_db()
-    # support numeric user ids or ObjectId strings
-    user = None
-    try:
-        uid = int(user_id)
-        user = await db.users.find_one({"_id": uid})
-    except Exception:
-        user = await db.users.find_one({"_id": to_object_id(user_id)})
-    if not user or not user.get("is_active", True):
-        raise HTTPException(status_code=401, detail="User inactive or not found")
-    user["_id"] = str(user["_id"])  # for response use
-    return user
+    user = principal_cache.get(str(user_id))
+    if user is None:
+        db = await get_db()
+        # support numeric user ids or ObjectId strings
+        try:
+            uid = int(user_id)
+            user = await db.users.find_one({"_id": uid})
+        except Exception:
+            user = await db.users.find_one({"_id": to_object_id(user_id)})
+        if not user or not user.get("is_active", True):
+            raise HTTPException(status_code=401, detail="User inactive or not found")
+        user["_id"] = str(user["_id"])  # for response use
+        principal_cache.set(str(user_id), user)
+    # handlers get their own copy so they cannot alter the cached entry
+    return dict(user)
 
 
 def require_roles(*allowed_roles: str):
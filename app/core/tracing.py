@@ -0,0 +1,246 @@
+"""Local request tracing: request, service-function and Mongo-command spans.
+
+`TracingMiddleware` opens a root span per request. Service functions decorated with `@traced`
+and every Mongo command (through `TracingListener`) open child spans of whatever span is
+current. The current span lives in a context variable, so it follows `await`, tasks started
+with `asyncio.gather`/`create_task`, `run_in_threadpool`, and Motor's executor threads.
+
+Whether a request is traced is decided when it starts (TRACE_SAMPLE_RATE). Only sampled
+requests collect spans and get an `X-Trace-Id` response header; the others cost a timer and
+are kept as a root span alone if they take at least TRACE_SLOW_MS, so slow requests still show
+up. Kept traces go into an in-memory ring (queried through /admin/traces) and, when TRACE_FILE
+is set, are appended to it as JSON lines by a writer thread. No collector is needed.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pymongo import monitoring
+from .config import settings
+from .metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "sampled", "dropped")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = os.urandom(8).hex()
+        self.spans: list[Span] = []
+        self.sampled = sampled
+        self.dropped = 0
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start", "duration_ms", "attrs", "error", "_started")
+
+    def __init__(self, trace: Trace, name: str, kind: str, parent_id: str | None = None, attrs: dict | None = None):
+        self.trace, self.name, self.kind, self.parent_id = trace, name, kind, parent_id
+        self.span_id = os.urandom(4).hex()
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms: float | None = None
+        self.attrs = attrs or {}
+        self.error: str | None = None
+        if len(trace.spans) < settings.TRACE_MAX_SPANS:
+            trace.spans.append(self)
+        else:
+            trace.dropped += 1
+
+    def child(self, name: str, kind: str, attrs: dict | None = None) -> "Span":
+        return Span(self.trace, name, kind, self.span_id, attrs)
+
+    def finish(self, duration_ms: float | None = None):
+        self.duration_ms = duration_ms if duration_ms is not None else (time.perf_counter() - self._started) * 1000
+
+    def fail(self, exc: BaseException):
+        detail = getattr(exc, "detail", None) or str(exc)
+        status = getattr(exc, "status_code", None)
+        self.error = f"{type(exc).__name__}{f' {status}' if status else ''}: {detail}"
+
+    def as_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+_span: ContextVar[Span | None] = ContextVar("trace_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _span.get()
+
+
+def traced(fn):
+    """Record a span for each call made while a request is being traced; a plain call otherwise."""
+    name = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            parent = _span.get()
+            if parent is None:
+                return await fn(*args, **kwargs)
+            span = parent.child(name, "service")
+            token = _span.set(span)
+            try:
+                return await fn(*args, **kwargs)
+            except BaseException as exc:
+                span.fail(exc)
+                raise
+            finally:
+                _span.reset(token)
+                span.finish()
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        parent = _span.get()
+        if parent is None:
+            return fn(*args, **kwargs)
+        span = parent.child(name, "service")
+        token = _span.set(span)
+        try:
+            return fn(*args, **kwargs)
+        except BaseException as exc:
+            span.fail(exc)
+            raise
+        finally:
+            _span.reset(token)
+            span.finish()
+    return wrapper
+
+
+class TracingListener(monitoring.CommandListener):
+    """A span per Mongo command, parented to the span that awaited it."""
+
+    def __init__(self):
+        # (connection, request id) -> span between a command's start and its reply
+        self._pending: dict = {}
+
+    def started(self, event):
+        parent = _span.get()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        attrs = {"db": event.database_name}
+        if isinstance(collection, str):
+            attrs["collection"] = collection
+        self._pending[(event.connection_id, event.request_id)] = parent.child(f"mongo.{event.command_name}", "mongo", attrs)
+
+    def succeeded(self, event):
+        span = self._pending.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.finish(event.duration_micros / 1000)
+
+    def failed(self, event):
+        span = self._pending.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.error = f"{event.failure.get('codeName') or 'error'}: {event.failure.get('errmsg', '')}"
+            span.finish(event.duration_micros / 1000)
+
+
+# kept traces, newest last
+traces: deque = deque(maxlen=settings.TRACE_BUFFER_SIZE)
+_file_queue: queue.SimpleQueue | None = None
+
+
+def _write_file(q: queue.SimpleQueue, path: str):
+    while True:
+        line = q.get()
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+                # drain whatever queued up while the file was open
+                while not q.empty():
+                    f.write(q.get_nowait())
+        except OSError:
+            logger.exception("writing traces to %s failed", path)
+
+
+def _export(record: dict):
+    global _file_queue
+    traces.append(record)
+    if settings.TRACE_FILE:
+        if _file_queue is None:
+            _file_queue = queue.SimpleQueue()
+            threading.Thread(target=_write_file, args=(_file_queue, settings.TRACE_FILE), name="trace-writer", daemon=True).start()
+        _file_queue.put(json.dumps(record, default=str) + "\n")
+
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = Trace(sampled=random.random() < settings.TRACE_SAMPLE_RATE)
+        root = Span(trace, scope["method"], "request", attrs={"path": scope["path"]})
+        # unsampled requests leave no current span, so services and Mongo commands record nothing
+        token = _span.set(root) if trace.sampled else None
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                root.attrs["status"] = message["status"]
+                if trace.sampled:
+                    message["headers"] = [*message.get("headers", []), (b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as exc:
+            root.fail(exc)
+            raise
+        finally:
+            if token is not None:
+                _span.reset(token)
+            root.finish()
+            root.name = f"{scope['method']} {route_template(scope)}"
+            slow = root.duration_ms >= settings.TRACE_SLOW_MS
+            if trace.sampled or slow:
+                _export({
+                    "trace_id": trace.trace_id,
+                    "name": root.name,
+                    "start": round(root.start, 6),
+                    "duration_ms": round(root.duration_ms, 3),
+                    "status": root.attrs.get("status"),
+                    "kept": "sampled" if trace.sampled else "slow",
+                    "dropped_spans": trace.dropped,
+                    "spans": [s.as_dict() for s in trace.spans],
+                })
+
+
+def _summary(record: dict) -> dict:
+    return {k: v for k, v in record.items() if k != "spans"} | {"span_count": len(record["spans"])}
+
+
+def find_traces(route: str | None = None, min_ms: float = 0, limit: int = 50) -> list[dict]:
+    """Newest first; `route` matches a substring of the root span name ("GET /api/customer/pay-emi/{loan_id}")."""
+    found = []
+    for record in reversed(traces):
+        if record["duration_ms"] >= min_ms and (route is None or route in record["name"]):
+            found.append(_summary(record))
+            if len(found) >= limit:
+                break
+    return found
+
+
+def get_trace(trace_id: str) -> dict | None:
+    return next((record for record in traces if record["trace_id"] == trace_id), None)
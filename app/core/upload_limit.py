@@ -0,0 +1,51 @@
+"""Reject oversized multipart uploads before their body is read.
+
+FastAPI parses the whole form (spooling files to disk) before a route or dependency runs, so
+the size check in `document_service._stream_to_temp` only fires once the upload has been
+received. This middleware answers 413 from the Content-Length header instead, and for bodies
+sent without one it stops reading as soon as the limit is passed.
+"""
+from fastapi import HTTPException
+from .config import settings
+from ..utils.responses import MongoJSONResponse
+
+# room for the multipart boundaries, part headers and the other form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        limit = settings.UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD
+        detail = f"File exceeds {settings.UPLOAD_MAX_BYTES} bytes"
+        length = headers.get(b"content-length")
+        if length is not None:
+            if not length.isdigit() or int(length) > limit:
+                response = MongoJSONResponse({"detail": detail}, status_code=413)
+                await response(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI lets an HTTPException from body parsing through as the response
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,194 @@
+"""Index catalogue and the query shapes it has to serve.
+
+`INDEXES` is the single list `init_indexes` creates. `QUERY_SHAPES` registers every filter/sort
+combination the services send, with representative values, and `service_query_shapes` adds the
+queries built by service helpers (keyset cursor pages and the `$unionWith` loan aggregations)
+using those same helpers; `check_query_plans` explains each one and reports shapes whose
+winning plan scans a whole collection or sorts in memory. When you add a query to a service,
+register its shape here (and the index it needs) so `python -m app.scripts.check_query_plans`
+keeps covering it.
+"""
+from datetime import datetime
+from typing import NamedTuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from ..models.enums import LoanCollection, LoanStatus, Roles
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: list
+    name: str
+    unique: bool = False
+
+
+class QueryShape(NamedTuple):
+    name: str
+    collection: str
+    filter: dict
+    sort: list | None = None
+    # aggregation shapes are explained as this pipeline instead of filter/sort
+    pipeline: list | None = None
+
+
+# plan stages that mean a query is not served by an index; `$sort` is a pipeline sort that a
+# branch could not hand to its query (the merge sort after a `$unionWith` is expected)
+BAD_STAGES = {"COLLSCAN", "SORT", "$sort"}
+
+LOAN_PREFIXES = {LoanCollection.PERSONAL.value: "pl", LoanCollection.VEHICLE.value: "vl"}
+
+INDEXES: list[IndexSpec] = [
+    IndexSpec("users", [("email", ASCENDING)], "uniq_email", unique=True),
+    IndexSpec("users", [("customer_id", ASCENDING)], "users_cust_idx"),
+    IndexSpec("users", [("role", ASCENDING)], "users_role_idx"),
+    IndexSpec("bank_accounts", [("account_number", ASCENDING)], "uniq_account", unique=True),
+    IndexSpec("bank_accounts", [("customer_id", ASCENDING)], "acc_cust_idx"),
+    IndexSpec("kyc_details", [("customer_id", ASCENDING)], "uniq_kyc_customer", unique=True),
+    IndexSpec("kyc_details", [("kyc_status", ASCENDING), ("submitted_at", ASCENDING), ("_id", ASCENDING)], "kyc_status_submitted_idx"),
+    IndexSpec("transactions", [("customer_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], "txn_cust_created_idx"),
+    IndexSpec("transactions", [("loan_id", ASCENDING)], "txn_loan_idx"),
+    IndexSpec("document_blobs", [("refcount", ASCENDING), ("released_at", ASCENDING)], "blob_unreferenced_idx"),
+    IndexSpec("emi_auto_debit_batches", [("partition", ASCENDING), ("partitions", ASCENDING)], "emi_batch_partition_idx"),
+]
+for _coll, _prefix in LOAN_PREFIXES.items():
+    INDEXES += [
+        IndexSpec(_coll, [("loan_id", ASCENDING)], f"{_prefix}_loan_id_idx"),
+        IndexSpec(_coll, [("customer_id", ASCENDING), ("applied_at", DESCENDING), ("_id", DESCENDING)], f"{_prefix}_cust_applied_idx"),
+        IndexSpec(_coll, [("status", ASCENDING), ("applied_at", ASCENDING), ("_id", ASCENDING)], f"{_prefix}_status_applied_idx"),
+        # penalty scan (sorted the same way) and EMI auto-debit
+        IndexSpec(_coll, [("status", ASCENDING), ("next_emi_date", ASCENDING), ("_id", ASCENDING)], f"{_prefix}_status_due_id_idx"),
+    ]
+
+_now = datetime.utcnow()
+
+QUERY_SHAPES: list[QueryShape] = [
+    QueryShape("login_by_email", "users", {"email": "someone@example.com"}),
+    QueryShape("user_by_customer_id", "users", {"customer_id": 1}),
+    QueryShape("customers_for_summary_rebuild", "users", {"role": Roles.CUSTOMER}),
+    QueryShape("account_by_customer", "bank_accounts", {"customer_id": 1}),
+    QueryShape("guarded_debit", "bank_accounts", {"customer_id": 1, "balance": {"$gte": 100.0}}),
+    QueryShape("accounts_for_batch", "bank_accounts", {"customer_id": {"$in": [1, 2, 3]}}),
+    QueryShape("kyc_by_customer", "kyc_details", {"customer_id": 1}),
+    QueryShape("approved_kyc_for_apply", "kyc_details", {"customer_id": 1, "kyc_status": "approved"}),
+    QueryShape("pending_kyc_queue", "kyc_details", {"kyc_status": "pending"}, [("submitted_at", 1), ("_id", 1)]),
+    QueryShape("customer_transactions_page", "transactions", {"customer_id": 1}, [("created_at", -1), ("_id", -1)]),
+    QueryShape("statement_export", "transactions", {"customer_id": 1, "created_at": {"$gte": _now, "$lt": _now}}, [("created_at", 1), ("_id", 1)]),
+    QueryShape("unreferenced_blobs_sweep", "document_blobs", {"refcount": {"$lte": 0}, "released_at": {"$lt": _now}}),
+    QueryShape("unfinished_emi_batches", "emi_auto_debit_batches", {"partition": 0, "partitions": 4}),
+]
+for _coll, _prefix in LOAN_PREFIXES.items():
+    QUERY_SHAPES += [
+        QueryShape(f"{_prefix}_loan_by_id", _coll, {"loan_id": 1}),
+        QueryShape(f"{_prefix}_customer_loan_by_id", _coll, {"loan_id": 1, "customer_id": 1}),
+        QueryShape(f"{_prefix}_customer_loans_page", _coll, {"customer_id": 1}, [("applied_at", -1), ("_id", -1)]),
+        QueryShape(f"{_prefix}_customer_active_loans", _coll, {"customer_id": {"$in": [1, 2]}, "status": {"$in": [LoanStatus.ACTIVE, LoanStatus.MANAGER_APPROVED]}}),
+        QueryShape(
+            f"{_prefix}_manager_queue", _coll,
+            {"status": {"$in": [LoanStatus.APPLIED, LoanStatus.VERIFICATION_DONE, LoanStatus.PENDING_ADMIN_APPROVAL]}},
+            [("applied_at", 1), ("_id", 1)],
+        ),
+        QueryShape(f"{_prefix}_status_queue", _coll, {"status": LoanStatus.PENDING_ADMIN_APPROVAL}, [("applied_at", 1), ("_id", 1)]),
+        QueryShape(f"{_prefix}_penalty_scan", _coll, {"status": LoanStatus.ACTIVE, "next_emi_date": {"$lt": _now}}, [("next_emi_date", 1), ("_id", 1)]),
+        QueryShape(f"{_prefix}_emi_auto_debit", _coll, {"status": LoanStatus.ACTIVE, "next_emi_date": {"$lte": _now}, "customer_id": {"$mod": [4, 0]}}),
+    ]
+
+
+def service_query_shapes() -> list[QueryShape]:
+    """Shapes of the queries the services build with helpers: keyset pages and `$unionWith` reads.
+
+    Imported here rather than at module level because the services import the database layer.
+    """
+    from ..services.admin_service import APPROVAL_FIELDS, APPROVAL_SORT
+    from ..services.kyc_service import KYC_QUEUE_SORT, LOAN_QUEUE_FIELDS, LOAN_QUEUE_SORT
+    from ..services.loan_repository import COLLECTIONS, _union_pipeline
+    from ..services.loan_service import CUSTOMER_LOANS_FIELDS, CUSTOMER_LOANS_SORT
+    from ..services.manager_service import QUEUE_FIELDS, QUEUE_SORT
+    from ..services.summary_service import ACTIVE_LOAN_STATUSES
+    from ..services.transaction_service import TXN_SORT
+    from ..utils.id import loan_id_filter
+    from ..utils.pagination import keyset_after, page_limit
+
+    limit = page_limit(None) + 1
+    after = [_now, ObjectId()]
+
+    def union(name: str, filt: dict, sort: list | None, limit: int | None, projection: dict | None) -> QueryShape:
+        return QueryShape(name, COLLECTIONS[0], filt, sort, _union_pipeline(filt, sort, limit, projection))
+
+    manager_queue = {"status": {"$in": [LoanStatus.APPLIED, LoanStatus.VERIFICATION_DONE, LoanStatus.PENDING_ADMIN_APPROVAL]}}
+    return [
+        QueryShape("pending_kyc_queue_next_page", "kyc_details", keyset_after({"kyc_status": "pending"}, KYC_QUEUE_SORT, after), KYC_QUEUE_SORT),
+        QueryShape("customer_transactions_next_page", "transactions", keyset_after({"customer_id": 1}, TXN_SORT, after), TXN_SORT),
+        union("find_loan_union", loan_id_filter("1"), None, 1, None),
+        union("customer_loans_union", {"customer_id": 1}, CUSTOMER_LOANS_SORT, limit, CUSTOMER_LOANS_FIELDS),
+        union("customer_loans_union_next_page", keyset_after({"customer_id": 1}, CUSTOMER_LOANS_SORT, after), CUSTOMER_LOANS_SORT, limit, CUSTOMER_LOANS_FIELDS),
+        union("manager_queue_union_next_page", keyset_after(manager_queue, QUEUE_SORT, after), QUEUE_SORT, limit, QUEUE_FIELDS),
+        union(
+            "verification_loan_queue_union_next_page",
+            keyset_after({"status": LoanStatus.ASSIGNED_TO_VERIFICATION}, LOAN_QUEUE_SORT, after), LOAN_QUEUE_SORT, limit, LOAN_QUEUE_FIELDS,
+        ),
+        union(
+            "admin_approvals_union_next_page",
+            keyset_after({"status": LoanStatus.PENDING_ADMIN_APPROVAL}, APPROVAL_SORT, after), APPROVAL_SORT, limit, APPROVAL_FIELDS,
+        ),
+        union("customer_loan_totals_union", {"customer_id": {"$in": [1, 2]}, "status": {"$in": ACTIVE_LOAN_STATUSES}}, None, None, None),
+    ]
+
+
+def query_shapes() -> list[QueryShape]:
+    return QUERY_SHAPES + service_query_shapes()
+
+
+def _plan_stages(plan) -> list[str]:
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if isinstance(plan.get("stage"), str) else []
+        for value in plan.values():
+            stages += _plan_stages(value)
+        return stages
+    if isinstance(plan, list):
+        return [s for item in plan for s in _plan_stages(item)]
+    return []
+
+
+def _explain_stages(result) -> list[str]:
+    """Winning-plan stages of every query in an explain result (each branch of an aggregation),
+    plus `$sort` for a pipeline sort that runs before the branches are merged."""
+    if isinstance(result, list):
+        return [s for item in result for s in _explain_stages(item)]
+    if not isinstance(result, dict):
+        return []
+    stages = _plan_stages(result["winningPlan"]) if "winningPlan" in result else []
+    for key, value in result.items():
+        if key in ("winningPlan", "rejectedPlans"):
+            continue
+        if key in ("stages", "pipeline") and isinstance(value, list):
+            merged = False
+            for stage in value:
+                if isinstance(stage, dict) and "$unionWith" in stage:
+                    merged = True
+                elif isinstance(stage, dict) and "$sort" in stage and not merged:
+                    stages.append("$sort")
+        stages += _explain_stages(value)
+    return stages
+
+
+async def explain_shape(db, shape: QueryShape) -> list[str]:
+    """Stage names of the winning plan(s) for one registered query shape."""
+    if shape.pipeline is not None:
+        cmd = {"aggregate": shape.collection, "pipeline": shape.pipeline, "cursor": {}}
+    else:
+        cmd = {"find": shape.collection, "filter": shape.filter}
+        if shape.sort:
+            cmd["sort"] = dict(shape.sort)
+    result = await db.command({"explain": cmd, "verbosity": "queryPlanner"})
+    return _explain_stages(result)
+
+
+async def check_query_plans(db) -> list[dict]:
+    """Explain every registered shape; return the ones that fall back to COLLSCAN or an in-memory sort."""
+    problems = []
+    for shape in query_shapes():
+        stages = await explain_shape(db, shape)
+        bad = sorted(BAD_STAGES.intersection(stages))
+        if bad:
+            problems.append({"shape": shape.name, "collection": shape.collection, "stages": stages, "bad": bad})
+    return problems
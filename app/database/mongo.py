@@ -1,14 +1,22 @@
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING
 from ..core.config import settings
+from ..core.diagnostics import DiagnosticsListener
+from ..core.metrics import MongoCommandListener
+from ..core.tracing import TracingListener
+from .indexes import INDEXES
 
 client: AsyncIOMotorClient | None = None
 
 def get_client() -> AsyncIOMotorClient:
     global client
     if client is None:
-        client = AsyncIOMotorClient(settings.MONGODB_URI)
+        listeners = [MongoCommandListener()] if settings.METRICS_ENABLED else []
+        # idle until diagnostics are switched on in system_settings
+        listeners.append(DiagnosticsListener())
+        if settings.TRACING_ENABLED:
+            listeners.append(TracingListener())
+        client = AsyncIOMotorClient(settings.MONGODB_URI, event_listeners=listeners)
     return client
 
 async def get_db():
@@ -16,16 +24,9 @@ async def get_db():
 
 async def init_indexes():
     db = await get_db()
-    # Unique index on user email
-    await db.users.create_index([("email", ASCENDING)], unique=True, name="uniq_email")
-    # Unique account number
-    await db.bank_accounts.create_index([("account_number", ASCENDING)], unique=True, name="uniq_account")
-    # Common indexes
-    await db.personal_loans.create_index([("customer_id", ASCENDING)], name="pl_cust_idx")
-    await db.vehicle_loans.create_index([("customer_id", ASCENDING)], name="vl_cust_idx")
-    await db.transactions.create_index([("customer_id", ASCENDING)], name="txn_cust_idx")
-    await db.transactions.create_index([("loan_id", ASCENDING)], name="txn_loan_idx")
-    await db.kyc_details.create_index([("customer_id", ASCENDING)], unique=True, name="uniq_kyc_customer")
+    # every index the services rely on is declared in database/indexes.py
+    for spec in INDEXES:
+        await db[spec.collection].create_index(spec.keys, name=spec.name, unique=spec.unique)
     # Counter for account numbers
     await db.counters.update_one(
         {"_id": "account_number"},
@@ -1,14 +1,58 @@
 
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from .core import diagnostics, loop_monitor, metrics, profiling, tracing
+from .core.upload_limit import UploadLimitMiddleware
 from .core.config import settings
+from .core.security import principal_cache, hashing_pool_stats
 from .database.mongo import init_indexes
+from .services.settings_service import get_settings, poll_settings
+from .services.diagnostics_service import poll_explains
+from .services.document_service import start_pdf_pool, shutdown_pdf_pool, document_cache, validation_cache
+from .utils.responses import MongoJSONResponse
 from .routers import auth, customer, manager, verification, admin, transactions
 
-app = FastAPI(title=settings.APP_NAME)
+app = FastAPI(title=settings.APP_NAME, default_response_class=MongoJSONResponse)
+
+background_tasks: list[asyncio.Task] = []
+
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(diagnostics.DiagnosticsMiddleware)
+if settings.TRACING_ENABLED:
+    app.add_middleware(tracing.TracingMiddleware)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+if settings.LOOP_MONITOR_ENABLED:
+    app.add_middleware(loop_monitor.LoopMonitorMiddleware)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.register_stats("principal_cache", principal_cache.stats)
+    metrics.register_stats("bcrypt_pool", hashing_pool_stats)
+    metrics.register_stats("document_cache", document_cache.stats)
+    metrics.register_stats("pdf_validation_cache", validation_cache.stats)
+    metrics.register_stats("event_loop_lag", loop_monitor.lag_stats)
 
 @app.on_event("startup")
 async def on_startup():
+    if settings.PROFILING_ENABLED:
+        profiling.install_task_factory()
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.install_task_factory()
     await init_indexes()
+    await get_settings()
+    background_tasks.append(asyncio.create_task(poll_settings()))
+    background_tasks.append(asyncio.create_task(poll_explains()))
+    if settings.LOOP_MONITOR_ENABLED:
+        background_tasks.append(asyncio.create_task(loop_monitor.probe_loop_lag()))
+    start_pdf_pool()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    shutdown_pdf_pool()
 
 app.include_router(auth.router, prefix=settings.API_PREFIX)
 app.include_router(customer.router, prefix=settings.API_PREFIX)
@@ -20,3 +64,9 @@ app.include_router(transactions.router, prefix=settings.API_PREFIX)
 @app.get('/')
 async def health():
     return {"status": "ok"}
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics_endpoint():
+    if not settings.METRICS_ENABLED:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,17 +1,23 @@
 
-from fastapi import APIRouter, Depends
-from ..core.security import require_roles
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from ..core import diagnostics, loop_monitor, profiling, tracing
+from ..core.security import require_roles, principal_cache, hashing_pool_stats
 from ..models.enums import Roles, LoanCollection
 from ..services.admin_service import list_pending_admin_approvals
 from ..services.loan_service import admin_final_approve, send_sanction, mark_signed_received, disburse
 from ..services.settings_service import update_settings
-from ..schemas.settings import SystemSettingsUpdate
+from ..services.summary_service import rebuild_customer_summaries
+from ..services.document_service import document_cache, sweep_document_blobs
+from ..services.diagnostics_service import capture_explains
+from ..schemas.settings import SystemSettingsUpdate, DiagnosticsSettings, ProfilingSettings
+from ..utils.responses import MongoJSONResponse
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 @router.get('/pending-approvals')
-async def pending(user=Depends(require_roles(Roles.ADMIN))):
-    return await list_pending_admin_approvals()
+async def pending(cursor: str | None = None, limit: int | None = None, user=Depends(require_roles(Roles.ADMIN))):
+    return MongoJSONResponse(await list_pending_admin_approvals(cursor, limit))
 
 @router.put('/approve/{loan_collection}/{loan_id}')
 async def approve_route(loan_collection: LoanCollection, loan_id: str, user=Depends(require_roles(Roles.ADMIN))):
@@ -29,10 +35,96 @@ async def signed_route(loan_collection: LoanCollection, loan_id: str, user=Depen
 async def disburse_route(loan_collection: LoanCollection, loan_id: str, user=Depends(require_roles(Roles.ADMIN))):
     return await disburse(loan_collection.value, loan_id)
 
+@router.get('/principal-cache')
+async def principal_cache_stats(user=Depends(require_roles(Roles.ADMIN))):
+    return principal_cache.stats()
+
+@router.get('/hashing-pool')
+async def hashing_pool(user=Depends(require_roles(Roles.ADMIN))):
+    return hashing_pool_stats()
+
+@router.get('/document-cache')
+async def document_cache_stats(user=Depends(require_roles(Roles.ADMIN))):
+    return document_cache.stats()
+
+@router.post('/_rebuild-customer-summaries', tags=["maintenance"])
+async def rebuild_summaries(user=Depends(require_roles(Roles.ADMIN))):
+    """Recompute every customer_summary document from the source collections."""
+    return await rebuild_customer_summaries()
+
+@router.post('/_sweep-document-blobs', tags=["maintenance"])
+async def sweep_blobs(grace_seconds: int | None = None, user=Depends(require_roles(Roles.ADMIN))):
+    """Delete stored documents that no upload slot has referenced for the grace period."""
+    return await sweep_document_blobs(grace_seconds)
+
 @router.put('/settings')
 async def settings_update(payload: SystemSettingsUpdate, user=Depends(require_roles(Roles.ADMIN))):
     return await update_settings(user['_id'], payload.dict())
 
+@router.get('/diagnostics')
+async def diagnostics_report(limit: int = 20, user=Depends(require_roles(Roles.ADMIN))):
+    """Slowest query shapes and requests flagged as N+1 in this worker."""
+    return diagnostics.report(limit)
+
+@router.put('/diagnostics')
+async def diagnostics_update(payload: DiagnosticsSettings, user=Depends(require_roles(Roles.ADMIN))):
+    """Switch diagnostics on or off; other workers follow on their next settings poll."""
+    await update_settings(user['_id'], {"diagnostics": payload.dict()})
+    return diagnostics.config
+
+@router.post('/diagnostics/_explain', tags=["maintenance"])
+async def diagnostics_explain(top: int | None = None, refresh: bool = False, user=Depends(require_roles(Roles.ADMIN))):
+    """Capture explain output for the slowest query shapes seen so far."""
+    return await capture_explains(top, refresh)
+
+@router.delete('/diagnostics')
+async def diagnostics_reset(user=Depends(require_roles(Roles.ADMIN))):
+    diagnostics.reset()
+    return {"status": "cleared"}
+
+@router.get('/traces')
+async def traces(route: str | None = None, min_ms: float = 0, limit: int = 50, user=Depends(require_roles(Roles.ADMIN))):
+    """Kept traces in this worker, newest first, without their spans."""
+    return tracing.find_traces(route, min_ms, limit)
+
+@router.get('/traces/{trace_id}')
+async def trace_detail(trace_id: str, user=Depends(require_roles(Roles.ADMIN))):
+    trace = tracing.get_trace(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+@router.get('/event-loop')
+async def event_loop(user=Depends(require_roles(Roles.ADMIN))):
+    """Loop lag percentiles and the most recent stalls with the stack that caused them."""
+    return {"lag": loop_monitor.lag_stats(), "blocks": list(reversed(loop_monitor.blocks))}
+
+@router.put('/profiling')
+async def profiling_update(payload: ProfilingSettings, user=Depends(require_roles(Roles.ADMIN))):
+    """Set 1-in-N per-route request profiling; other workers follow on their next settings poll."""
+    await update_settings(user['_id'], {"profiling": payload.dict()})
+    return profiling.config
+
+@router.get('/profiles')
+async def profiles(route: str | None = None, limit: int = 50, user=Depends(require_roles(Roles.ADMIN))):
+    """Stored request profiles in this worker, newest first, without their stacks."""
+    return profiling.find_profiles(route, limit)
+
+def _profile_or_404(profile_id: str) -> dict:
+    record = profiling.get_profile(profile_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return record
+
+@router.get('/profiles/{profile_id}')
+async def profile_detail(profile_id: str, user=Depends(require_roles(Roles.ADMIN))):
+    return _profile_or_404(profile_id)
+
+@router.get('/profiles/{profile_id}/folded')
+async def profile_folded(profile_id: str, user=Depends(require_roles(Roles.ADMIN))):
+    """Folded stacks, ready for flamegraph.pl or speedscope."""
+    return PlainTextResponse(profiling.folded(_profile_or_404(profile_id)))
+
 
 from pydantic import BaseModel, EmailStr
 from ..services.admin_service import create_staff_user
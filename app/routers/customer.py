@@ -1,15 +1,17 @@
 
-from fastapi import APIRouter, Depends, File, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 from ..core.security import require_roles
 from ..models.enums import Roles, DocumentType
 from ..services.account_service import add_money
 from ..services.customer_service import profile_dashboard
-from ..services.kyc_service import submit_kyc
-from ..services.loan_service import apply_loan, pay_emi, list_customer_loans
+from ..services.kyc_service import submit_kyc, attach_kyc_document
+from ..services.loan_service import apply_loan, pay_emi, list_customer_loans, attach_loan_document
+from ..services.loan_repository import find_loan
 from ..schemas.loan import ApplyPersonalLoan, ApplyVehicleLoan, LoanOut
 from ..services.settings_service import get_settings
 from ..schemas.kyc import KYCSubmit, KYCOut
 from ..services.document_service import upload_document
+from ..utils.responses import MongoJSONResponse
 
 router = APIRouter(prefix="/customer", tags=["customer"])
 
@@ -55,9 +57,9 @@ async def pay_emi_by_id(loan_id: str, user=Depends(require_roles(Roles.CUSTOMER)
 
 
 @router.get('/loans')
-async def customer_loans(user=Depends(require_roles(Roles.CUSTOMER))):
+async def customer_loans(cursor: str | None = None, limit: int | None = None, user=Depends(require_roles(Roles.CUSTOMER))):
     cid = user.get("customer_id") or user.get("_id")
-    return await list_customer_loans(cid)
+    return MongoJSONResponse(await list_customer_loans(cid, cursor, limit))
 
 
 @router.post('/upload-kyc-document/{doc_type}')
@@ -66,8 +68,9 @@ async def upload_kyc_doc(doc_type: DocumentType, file: UploadFile = File(...), u
     if doc_type not in [DocumentType.PAN_CARD, DocumentType.AADHAR_CARD]:
         raise ValueError("doc_type must be 'pan_card' or 'aadhar_card'")
     cid = user.get("customer_id") or user.get("_id")
-    doc_path = await upload_document(file, f"kyc/{cid}", f"{doc_type.value}.pdf")
-    return {"document_type": doc_type.value, "file_path": doc_path}
+    stored = await upload_document(file, f"kyc/{cid}", f"{doc_type.value}.pdf")
+    await attach_kyc_document(cid, f"{doc_type.value}_url", stored["file_path"])
+    return {"document_type": doc_type.value, **stored}
 
 
 @router.post('/upload-loan-document/{loan_id}/{doc_type}')
@@ -76,5 +79,9 @@ async def upload_loan_doc(loan_id: str, doc_type: DocumentType, file: UploadFile
     if doc_type not in [DocumentType.PAY_SLIP, DocumentType.VEHICLE_PRICE_DOC]:
         raise ValueError("doc_type must be 'pay_slip' or 'vehicle_price_doc'")
     cid = user.get("customer_id") or user.get("_id")
-    doc_path = await upload_document(file, f"loans/{cid}/{loan_id}", f"{doc_type.value}.pdf")
-    return {"document_type": doc_type.value, "loan_id": loan_id, "file_path": doc_path}
+    collection, loan = await find_loan(loan_id, {"customer_id": cid}, {"_id": 1})
+    if not loan:
+        raise HTTPException(status_code=404, detail="Loan not found")
+    stored = await upload_document(file, f"loans/{cid}/{loan_id}", f"{doc_type.value}.pdf")
+    await attach_loan_document(collection, loan["_id"], f"{doc_type.value}_url", stored["file_path"])
+    return {"document_type": doc_type.value, "loan_id": loan_id, **stored}
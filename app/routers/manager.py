@@ -4,12 +4,13 @@ from ..core.security import require_roles
 from ..models.enums import Roles, LoanCollection
 from ..services.manager_service import get_loans_for_manager
 from ..services.loan_service import assign_verification, manager_approve_or_reject
+from ..utils.responses import MongoJSONResponse
 
 router = APIRouter(prefix="/manager", tags=["manager"])
 
 @router.get('/loans')
-async def list_loans(user=Depends(require_roles(Roles.MANAGER))):
-    return await get_loans_for_manager()
+async def list_loans(cursor: str | None = None, limit: int | None = None, user=Depends(require_roles(Roles.MANAGER))):
+    return MongoJSONResponse(await get_loans_for_manager(cursor, limit))
 
 @router.put('/assign-verification/{loan_collection}/{loan_id}/{verification_id}')
 async def assign_verification_route(loan_collection: LoanCollection, loan_id: str, verification_id: str, user=Depends(require_roles(Roles.MANAGER))):
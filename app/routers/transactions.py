@@ -1,35 +1,55 @@
 
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from ..core.security import require_roles
 from ..models.enums import Roles
-from ..services.transaction_service import list_transactions
+from ..services.transaction_service import list_transactions, iter_statement
+from ..utils.streaming import gzip_stream
+from ..utils.responses import MongoJSONResponse
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
 @router.get('/')
-async def list_txn(user=Depends(require_roles(Roles.CUSTOMER))):
+async def list_txn(cursor: str | None = None, limit: int | None = None, user=Depends(require_roles(Roles.CUSTOMER))):
     cid = user.get("customer_id") or user.get("_id")
-    return await list_transactions(cid)
+    return MongoJSONResponse(await list_transactions(cid, cursor, limit))
 
 
-from datetime import datetime
-from ..models.enums import LoanStatus
-from ..database.mongo import get_db
+@router.get('/export')
+async def export_txn(
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    start: datetime | None = None,
+    end: datetime | None = None,
+    gzip: bool = False,
+    user=Depends(require_roles(Roles.CUSTOMER)),
+):
+    """Stream the full statement for [start, end) as NDJSON or CSV, optionally gzipped."""
+    cid = user.get("customer_id") or user.get("_id")
+    body = iter_statement(cid, format, start, end)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"statement-{cid}.{format}"
+    if gzip:
+        body = gzip_stream(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+from ..services.penalty_service import run_penalty_scan
 
 @router.post('/_run-emi-penalty-scan', tags=["maintenance"])
-async def run_emi_penalty_scan(user=Depends(require_roles(Roles.ADMIN))):
-    """Scan ACTIVE loans with next_emi_date in past and penalize CIBIL (-5, min 300)."""
-    db = await get_db()
-    now = datetime.utcnow()
-    penalized = 0
-    for coll_name in ['personal_loans', 'vehicle_loans']:
-        loans = await db[coll_name].find({"status": LoanStatus.ACTIVE, "next_emi_date": {"$lt": now}}).to_list(length=1000)
-        for loan in loans:
-            kyc = await db.kyc_details.find_one({"customer_id": loan['customer_id']})
-            if kyc:
-                new_cibil = max(300, int(kyc.get('cibil_score', 0)) - 5)
-                await db.kyc_details.update_one({"_id": kyc['_id']}, {"$set": {"cibil_score": new_cibil}})
-            # push due to next cycle to avoid repeated penalty until next scan
-            await db[coll_name].update_one({"_id": loan['_id']}, {"$set": {"next_emi_date": now}})
-            penalized += 1
-    return {"penalized": penalized}
+async def run_emi_penalty_scan(resume: bool = True, batch_size: int | None = None, user=Depends(require_roles(Roles.ADMIN))):
+    """Scan ACTIVE loans with next_emi_date in past and penalize CIBIL (-5, min 300).
+
+    Resumes an interrupted scan from its last checkpoint unless `resume=false`.
+    """
+    return await run_penalty_scan(batch_size=batch_size, resume=resume)
+
+
+from ..services.emi_batch_service import run_emi_auto_debit
+
+@router.post('/_run-emi-auto-debit', tags=["maintenance"])
+async def run_emi_auto_debit_route(partition: int = 0, partitions: int = 1, user=Depends(require_roles(Roles.ADMIN))):
+    """Debit every due EMI on ACTIVE loans for customers with customer_id % partitions == partition."""
+    return await run_emi_auto_debit(partition=partition, partitions=partitions)
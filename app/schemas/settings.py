@@ -1,7 +1,19 @@
 
+from typing import Optional
 from pydantic import BaseModel
 
 class SystemSettingsUpdate(BaseModel):
     personal_loan_interest: float
     vehicle_loan_interest: float
     min_cibil_required: int
+
+class DiagnosticsSettings(BaseModel):
+    enabled: bool
+    # unset fields fall back to the DIAGNOSTICS_* defaults
+    slow_command_ms: Optional[float] = None
+    max_commands_per_request: Optional[int] = None
+    repeated_shape_threshold: Optional[int] = None
+
+class ProfilingSettings(BaseModel):
+    # profile one in every N requests per route; 0 turns sampling off
+    sample_every: int = 0
@@ -0,0 +1,205 @@
+"""Micro-benchmarks for the pure functions on the hot request and batch paths.
+
+Each case is timed as a single call and over 10k/100k-item batches of realistic inputs
+(fixed seed, so runs are comparable). Every measurement is taken `--runs` times and the median
+is kept, together with the spread between the fastest and slowest run. `run --save` stores the
+results as the baseline; `compare` runs again and exits non-zero when any case is slower than
+its baseline by more than `--threshold` percent, or by more than twice the spread measured for
+that case if that is larger, so run-to-run noise does not fail the check.
+
+Baselines are only comparable on the same machine and Python, so none is committed: record one
+on the machine that runs the comparison (`bench_baseline.json` next to this script, ignored by
+git), from the commit you want to compare against.
+
+    python -m app.scripts.bench_hot_paths run
+    python -m app.scripts.bench_hot_paths run --save
+    python -m app.scripts.bench_hot_paths compare
+    python -m app.scripts.bench_hot_paths compare --only compute_emi --sizes 1 10000
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from bson import ObjectId
+from ..services.kyc_service import compute_scores
+from ..services.loan_service import build_loan_doc, compute_emi
+from ..utils.dates import next_month_date
+from ..utils.id import loan_id_filter
+from ..utils.serializers import normalize_doc
+
+BASELINE = Path(__file__).with_name("bench_baseline.json")
+SIZES = [1, 10_000, 100_000]
+NOW = datetime(2024, 1, 1)
+
+
+def _loan_payload(rnd: random.Random) -> dict:
+    return {
+        "bank_account_number": rnd.randint(1_000_000_001, 1_000_100_000),
+        "full_name": "Customer",
+        "pan_number": "ABCDE1234F",
+        "loan_amount": rnd.choice([100_000, 500_000, 1_200_000, 2_500_000]),
+        "loan_purpose": "home renovation",
+        "salary_income": rnd.uniform(20_000, 200_000),
+        "monthly_avg_balance": rnd.uniform(5_000, 100_000),
+        "tenure_months": rnd.choice([12, 24, 36, 60]),
+        "pay_slip_url": None,
+    }
+
+
+def _kyc_payload(rnd: random.Random) -> dict:
+    return {
+        "employment_status": rnd.choice(["employed", "self_employed", "unemployed"]),
+        "monthly_income": rnd.uniform(10_000, 150_000),
+        "existing_emi_months": rnd.choice([0, 6, 12, 24]),
+        "years_of_experience": rnd.randint(0, 20),
+    }
+
+
+def _stored_loan(rnd: random.Random, i: int) -> dict:
+    doc = build_loan_doc(i, rnd.randint(1, 10_000), _loan_payload(rnd), 12.0, rnd.randint(300, 850), NOW)
+    doc.update(manager_id=ObjectId(), verification_id=ObjectId(), approved_at=NOW, disbursed_at=NOW)
+    return doc
+
+
+# name -> (input factory(rnd, i), call(item)); a batch applies `call` to n prepared inputs
+CASES = {
+    "compute_emi": (
+        lambda rnd, i: (rnd.uniform(50_000, 3_000_000), rnd.choice([0.0, 10.5, 12.0, 14.0]), rnd.choice([12, 24, 36, 60])),
+        lambda args: compute_emi(*args),
+    ),
+    "build_loan_doc": (
+        lambda rnd, i: (i, rnd.randint(1, 10_000), _loan_payload(rnd), 12.0, rnd.randint(300, 850), NOW),
+        lambda args: build_loan_doc(*args),
+    ),
+    "compute_scores": (lambda rnd, i: _kyc_payload(rnd), compute_scores),
+    "normalize_doc": (_stored_loan, normalize_doc),
+    "loan_id_filter[numeric]": (lambda rnd, i: str(rnd.randint(1, 10_000_000)), loan_id_filter),
+    "loan_id_filter[objectid]": (lambda rnd, i: str(ObjectId()), loan_id_filter),
+    "next_month_date": (lambda rnd, i: NOW + timedelta(seconds=rnd.randint(0, 10**8)), next_month_date),
+}
+
+
+def _time_batch(call, items: list, repeat: int) -> float:
+    """Best wall time over `repeat` passes applying `call` to every item, after one warm-up pass.
+
+    The collector is paused while timing, as `timeit` does, so a collection triggered by
+    earlier allocations does not land in one case's numbers.
+    """
+    best = float("inf")
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat + 1):
+            started = time.perf_counter()
+            for item in items:
+                call(item)
+            best = min(best, time.perf_counter() - started)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+
+def _time_single(call, item, min_seconds: float = 0.2, repeat: int = 7) -> float:
+    """Best per-call time for one input, looping enough calls to be measurable."""
+    number = 1
+    while _time_batch(call, [item] * number, 1) < min_seconds / 10:
+        number *= 10
+    return _time_batch(call, [item] * number, repeat) / number
+
+
+def run_cases(only: list[str] | None, sizes: list[int], repeat: int) -> dict:
+    results = {}
+    for name, (make, call) in CASES.items():
+        if only and not any(o in name for o in only):
+            continue
+        rnd = random.Random(42)
+        items = [make(rnd, i) for i in range(1, max(sizes) + 1)]
+        for size in sizes:
+            if size == 1:
+                seconds = _time_single(call, items[0], repeat=repeat)
+            else:
+                seconds = _time_batch(call, items[:size], repeat) / size
+            results[f"{name} x{size}"] = seconds * 1e9
+    return results
+
+
+def measure(only: list[str] | None, sizes: list[int], repeat: int, runs: int) -> tuple[dict, dict]:
+    """Median ns/call per case over `runs` runs, and the spread (max - min) / median in percent."""
+    samples: dict[str, list[float]] = {}
+    for i in range(runs):
+        print(f"run {i + 1}/{runs}", file=sys.stderr)
+        for case, ns in run_cases(only, sizes, repeat).items():
+            samples.setdefault(case, []).append(ns)
+    results, spread = {}, {}
+    for case, values in samples.items():
+        median = statistics.median(values)
+        results[case] = round(median, 1)
+        spread[case] = round((max(values) - min(values)) / median * 100, 1)
+        print(f"{case:<34} {results[case]:>12,.1f} ns/call  ±{spread[case]:.0f}%")
+    return results, spread
+
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(), "machine": platform.machine()}
+
+
+def compare(current: dict, current_spread: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    base_spread = baseline.get("spread", {})
+    print(f"\n{'case':<34} {'baseline':>12} {'current':>12} {'change':>9} {'limit':>7}")
+    for case, ns in current.items():
+        base = baseline["results"].get(case)
+        if base is None:
+            print(f"{case:<34} {'-':>12} {ns:>12,.1f} {'new':>9}")
+            continue
+        change = (ns - base) / base * 100
+        limit = max(threshold, 2 * base_spread.get(case, 0), 2 * current_spread.get(case, 0))
+        flag = "  REGRESSION" if change > limit else ""
+        print(f"{case:<34} {base:>12,.1f} {ns:>12,.1f} {change:>+8.1f}% {limit:>6.0f}%{flag}")
+        if flag:
+            regressions.append(case)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot pure functions against a stored baseline")
+    parser.add_argument("command", choices=["run", "compare"])
+    parser.add_argument("--save", action="store_true", help="run: store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=30.0,
+                        help="compare: percent slowdown that fails (raised per case to twice its measured spread)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--only", nargs="*", default=None, help="substring filter on case names")
+    parser.add_argument("--sizes", nargs="*", type=int, default=SIZES)
+    parser.add_argument("--repeat", type=int, default=7, help="passes per measurement; the best is kept")
+    parser.add_argument("--runs", type=int, default=5, help="measurements per case; the median is kept")
+    args = parser.parse_args()
+
+    if args.command == "compare" and not args.baseline.exists():
+        sys.exit(f"no baseline at {args.baseline}; record one on this machine with `run --save`")
+    results, spread = measure(args.only, args.sizes, args.repeat, args.runs)
+    if args.command == "run":
+        if args.save:
+            record = {"environment": environment(), "runs": args.runs, "results": results, "spread": spread}
+            args.baseline.write_text(json.dumps(record, indent=2) + "\n")
+            print(f"\nbaseline saved to {args.baseline}")
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("environment") != environment():
+        print(f"warning: baseline recorded on {baseline.get('environment')}, running on {environment()}")
+    regressions = compare(results, spread, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than baseline by more than their limit")
+        sys.exit(1)
+    print("\nno case slower than baseline by more than its limit")
+
+
+if __name__ == '__main__':
+    main()
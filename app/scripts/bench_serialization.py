@@ -0,0 +1,80 @@
+"""Measure response serialization cost per 1k loan documents.
+
+Compares the old path (`normalize_doc` on every document, then FastAPI's `jsonable_encoder`,
+then `JSONResponse`) with `MongoJSONResponse` encoding the raw documents. Needs no database.
+
+    python -m app.scripts.bench_serialization
+    python -m app.scripts.bench_serialization --docs 5000 --repeat 20
+"""
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from ..models.enums import LoanStatus
+from ..utils.responses import MongoJSONResponse
+from ..utils.serializers import normalize_doc
+
+
+def sample_loans(n: int) -> list[dict]:
+    now = datetime.utcnow()
+    loans = []
+    for i in range(1, n + 1):
+        tenure = random.choice([12, 24, 36, 60])
+        emi = round(random.uniform(1_000, 50_000), 2)
+        loans.append({
+            "_id": i,
+            "loan_id": i,
+            "customer_id": random.randint(1, 10_000),
+            "loan_amount": round(emi * tenure * 0.9, 2),
+            "tenure_months": tenure,
+            "salary_income": round(random.uniform(20_000, 200_000), 2),
+            "remaining_tenure": tenure,
+            "emi_per_month": emi,
+            "remaining_amount": round(emi * tenure, 2),
+            "total_paid": 0.0,
+            "cibil_score_at_apply": random.randint(300, 850),
+            "max_eligible_amount": 1_200_000.0,
+            "status": LoanStatus.ACTIVE,
+            "manager_id": ObjectId(),
+            "verification_id": ObjectId(),
+            "admin_id": ObjectId(),
+            "next_emi_date": now + timedelta(days=30),
+            "applied_at": now - timedelta(days=random.randint(1, 365)),
+            "approved_at": now,
+            "disbursed_at": now,
+            "loan_collection": "personal_loans",
+        })
+    return loans
+
+
+def old_path(loans: list[dict]) -> bytes:
+    page = {"items": [normalize_doc(l) for l in loans], "next_cursor": None}
+    return JSONResponse(jsonable_encoder(page)).body
+
+
+def new_path(loans: list[dict]) -> bytes:
+    return MongoJSONResponse({"items": loans, "next_cursor": None}).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loan list serialization")
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    loans = sample_loans(args.docs)
+    per_1k = 1000 / args.docs
+    results = {}
+    for name, fn in [("normalize_doc + jsonable_encoder", old_path), ("MongoJSONResponse", new_path)]:
+        best = min(timeit.repeat(lambda: fn(loans), number=1, repeat=args.repeat))
+        results[name] = best * per_1k * 1000
+        print(f"{name:<34} {results[name]:8.2f} ms per 1k docs ({len(fn(loans)) / 1024:.0f} KiB)")
+    old, new = results.values()
+    print(f"{'speedup':<34} {old / new:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
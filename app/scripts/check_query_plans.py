@@ -0,0 +1,38 @@
+"""Fail when a registered query shape is not served by an index.
+
+Explains every shape in `app/database/indexes.py` (find filters, keyset pages and the
+`$unionWith` loan aggregations) against the configured database and exits non-zero if any
+winning plan contains a COLLSCAN or a blocking in-memory SORT.
+
+    python -m app.scripts.check_query_plans            # check against the existing indexes
+    python -m app.scripts.check_query_plans --init     # create the catalogue indexes first
+"""
+import argparse
+import asyncio
+import sys
+
+from ..database.indexes import check_query_plans, query_shapes
+from ..database.mongo import get_db, init_indexes
+
+
+async def run(init: bool) -> int:
+    if init:
+        await init_indexes()
+    db = await get_db()
+    total = len(query_shapes())
+    problems = await check_query_plans(db)
+    for p in problems:
+        print(f"✗ {p['shape']} ({p['collection']}): {' -> '.join(p['stages'])}")
+    print(f"{total - len(problems)}/{total} query shapes use an index without an in-memory sort")
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every registered query shape is index-backed")
+    parser.add_argument("--init", action="store_true", help="create the catalogue indexes before checking")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.init)))
+
+
+if __name__ == '__main__':
+    main()
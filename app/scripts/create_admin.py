@@ -17,7 +17,7 @@ async def create_admin(email: str, full_name: str, password: str):
     doc = {
         "full_name": full_name,
         "email": email,
-        "password": hash_password(password),
+        "password": await hash_password(password),
         "phone": None,
         "dob": None,
         "gender": None,
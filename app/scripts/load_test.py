@@ -0,0 +1,241 @@
+"""Load-test the full loan lifecycle against the real app, in process.
+
+Drives `app.main:app` through an httpx ASGI transport (no server, no network) against a real
+MongoDB, in a throwaway database that is dropped afterwards. Every virtual customer runs:
+
+    register -> login -> submit KYC -> verify KYC -> apply -> assign verification ->
+    verify loan -> manager approve [-> admin approve] -> sanction -> signed -> disburse ->
+    pay EMI -> profile -> loan list
+
+`--concurrency` customers run at once. The report gives per-step p50/p95/p99 latency, error
+counts, throughput, and the Mongo commands each step issued (counted by a pymongo command
+listener and attributed to the request through a context variable).
+
+    python -m app.scripts.load_test --customers 200 --concurrency 20
+    python -m app.scripts.load_test --mongo-uri mongodb://localhost:27017 --bcrypt-rounds 4 --json out.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+import httpx
+from pymongo import monitoring
+from ..core.config import settings
+
+# Counter of Mongo commands issued on behalf of the current request (None outside one)
+_commands: ContextVar[Counter | None] = ContextVar("load_test_commands", default=None)
+
+
+class CommandCounter(monitoring.CommandListener):
+    # Motor runs pymongo on executor threads with the caller's context copied in, so the
+    # request's counter is visible here
+    def started(self, event):
+        counter = _commands.get()
+        if counter is not None:
+            counter[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.commands: dict[str, Counter] = defaultdict(Counter)
+        self.error_samples: dict[str, str] = {}
+
+    async def call(self, client: httpx.AsyncClient, step: str, method: str, url: str, token: str | None = None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        counter = Counter()
+        ctx_token = _commands.set(counter)
+        started = time.perf_counter()
+        try:
+            resp = await client.request(method, url, headers=headers, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            _commands.reset(ctx_token)
+        self.latencies[step].append(elapsed)
+        self.commands[step].update(counter)
+        if resp.status_code >= 400:
+            self.errors[step] += 1
+            self.error_samples.setdefault(step, f"{resp.status_code} {resp.text[:200]}")
+            raise StepFailed(step)
+        return resp.json() if resp.content else None
+
+
+class StepFailed(Exception):
+    pass
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def _login(client, rec: Recorder, step: str, email: str, password: str) -> str:
+    body = await rec.call(client, step, "POST", "/api/auth/login", json={"email": email, "password": password})
+    return body["access_token"]
+
+
+async def setup_staff(client, rec: Recorder, password: str) -> dict:
+    """Create an admin directly, then a manager and a verifier through the API; return tokens and ids."""
+    from .create_admin import create_admin
+    await create_admin("loadtest-admin@example.com", "Load Test Admin", password)
+    admin = await _login(client, rec, "setup: login", "loadtest-admin@example.com", password)
+    staff = {"admin": admin}
+    for role in ("manager", "verification"):
+        email = f"loadtest-{role}@example.com"
+        user = await rec.call(client, "setup: create staff", "POST", "/api/admin/create-staff", admin,
+                              json={"email": email, "full_name": f"Load Test {role}", "password": password, "role": role})
+        staff[role] = await _login(client, rec, "setup: login", email, password)
+        staff[f"{role}_id"] = user["_id"]
+    return staff
+
+
+async def lifecycle(client, rec: Recorder, staff: dict, n: int, password: str, large_share: float):
+    email = f"customer{n}@loadtest.example.com"
+    reg = await rec.call(client, "register", "POST", "/api/auth/register",
+                         json={"full_name": f"Customer {n}", "email": email, "password": password})
+    cid = reg["customer_id"]
+    token = await _login(client, rec, "login", email, password)
+    await rec.call(client, "submit kyc", "POST", "/api/customer/submit-kyc", token, json={
+        "full_name": f"Customer {n}", "dob": "1990-01-01", "nationality": "Indian",
+        "employment_status": "employed", "monthly_income": 90000, "existing_emi_months": 0, "years_of_experience": 6,
+    })
+    await rec.call(client, "verify kyc", "PUT", f"/api/verification/verify-kyc/{cid}", staff["verification"],
+                   json={"approve": True, "employment_score": 25, "income_score": 25, "emi_score": 25, "experience_score": 25})
+
+    amount = random.choice([2_000_000, 2_500_000]) if random.random() < large_share else random.choice([100_000, 500_000, 1_200_000])
+    loan = await rec.call(client, "apply loan", "POST", "/api/customer/apply-personal-loan", token, json={
+        "bank_account_number": reg["account_number"], "full_name": f"Customer {n}", "pan_number": f"ABCDE{n:04d}F",
+        "loan_amount": amount, "loan_purpose": "load test", "salary_income": 90000,
+        "monthly_avg_balance": 50000, "tenure_months": 24,
+    })
+    path = f"personal_loans/{loan['_id']}"
+    await rec.call(client, "assign verification", "PUT", f"/api/manager/assign-verification/{path}/{staff['verification_id']}", staff["manager"])
+    await rec.call(client, "verify loan", "PUT", f"/api/verification/verify-loan/{path}", staff["verification"], params={"approved": True})
+    await rec.call(client, "manager approve", "PUT", f"/api/manager/approve/{path}", staff["manager"])
+    if amount > 1_500_000:
+        await rec.call(client, "admin approve", "PUT", f"/api/admin/approve/{path}", staff["admin"])
+    await rec.call(client, "sanction", "PUT", f"/api/admin/sanction/{path}", staff["admin"])
+    await rec.call(client, "signed", "PUT", f"/api/admin/signed/{path}", staff["admin"])
+    await rec.call(client, "disburse", "PUT", f"/api/admin/disburse/{path}", staff["admin"])
+    await rec.call(client, "pay emi", "POST", f"/api/customer/pay-emi/{loan['_id']}", token)
+    await rec.call(client, "profile", "GET", "/api/customer/get/profile", token)
+    await rec.call(client, "loan list", "GET", "/api/customer/loans", token)
+
+
+def report(rec: Recorder, wall: float, completed: int, failed: int) -> dict:
+    steps = {}
+    for step, lat in rec.latencies.items():
+        total_cmds = sum(rec.commands[step].values())
+        steps[step] = {
+            "count": len(lat),
+            "errors": rec.errors[step],
+            "p50_ms": round(percentile(lat, 50) * 1000, 2),
+            "p95_ms": round(percentile(lat, 95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 99) * 1000, 2),
+            "mean_ms": round(sum(lat) / len(lat) * 1000, 2),
+            "mongo_ops_per_request": round(total_cmds / len(lat), 2),
+            "mongo_ops": dict(rec.commands[step].most_common()),
+        }
+    requests = sum(len(l) for l in rec.latencies.values())
+    return {
+        "lifecycles_completed": completed,
+        "lifecycles_failed": failed,
+        "requests": requests,
+        "wall_seconds": round(wall, 3),
+        "requests_per_sec": round(requests / wall, 1) if wall else 0.0,
+        "lifecycles_per_sec": round(completed / wall, 2) if wall else 0.0,
+        "steps": steps,
+        "error_samples": rec.error_samples,
+    }
+
+
+def print_report(result: dict):
+    print(f"\n{'step':<24}{'count':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ops/req':>9}  commands")
+    for step, s in result["steps"].items():
+        cmds = " ".join(f"{k}={v}" for k, v in s["mongo_ops"].items())
+        print(f"{step:<24}{s['count']:>7}{s['errors']:>5}{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}{s['mongo_ops_per_request']:>9}  {cmds}")
+    print(
+        f"\n{result['lifecycles_completed']} lifecycles ok, {result['lifecycles_failed']} failed; "
+        f"{result['requests']} requests in {result['wall_seconds']}s = "
+        f"{result['requests_per_sec']} req/s, {result['lifecycles_per_sec']} lifecycles/s"
+    )
+    for step, sample in result["error_samples"].items():
+        print(f"  first error in {step}: {sample}")
+
+
+async def run(args) -> dict:
+    if args.db == settings.MONGODB_DB:
+        raise SystemExit(f"refusing to use the configured database {args.db!r}; it is dropped before and after the run")
+    settings.MONGODB_URI = args.mongo_uri or settings.MONGODB_URI
+    settings.MONGODB_DB = args.db
+    if args.bcrypt_rounds:
+        settings.BCRYPT_ROUNDS = args.bcrypt_rounds
+    # must be registered before the app's client is created
+    monitoring.register(CommandCounter())
+    from ..database.mongo import get_client
+    from ..main import app
+
+    await get_client().drop_database(args.db)
+    await app.router.startup()
+    rec = Recorder()
+    password = "LoadTest#123"
+    completed = failed = 0
+    try:
+        # app exceptions become 500s and count as step errors instead of aborting the run
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            staff = await setup_staff(client, rec, password)
+            for step in [s for s in rec.latencies if s.startswith("setup")]:
+                del rec.latencies[step], rec.commands[step]
+            sem = asyncio.Semaphore(args.concurrency)
+
+            async def one(n):
+                nonlocal completed, failed
+                async with sem:
+                    try:
+                        await lifecycle(client, rec, staff, n, password, args.large_share)
+                        completed += 1
+                    except StepFailed:
+                        failed += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(n) for n in range(1, args.customers + 1)))
+            wall = time.perf_counter() - started
+    finally:
+        await app.router.shutdown()
+        if not args.keep:
+            await get_client().drop_database(args.db)
+    return report(rec, wall, completed, failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the loan lifecycle under load against an in-process app")
+    parser.add_argument("--customers", type=int, default=100, help="virtual customers, one full lifecycle each")
+    parser.add_argument("--concurrency", type=int, default=10, help="lifecycles running at once")
+    parser.add_argument("--large-share", type=float, default=0.2, help="fraction of loans above 15 lakh (admin approval)")
+    parser.add_argument("--mongo-uri", default=None, help="defaults to MONGODB_URI")
+    parser.add_argument("--db", default="pay_crest_loadtest", help="throwaway database, dropped before and after")
+    parser.add_argument("--keep", action="store_true", help="keep the database after the run")
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="override BCRYPT_ROUNDS (register/login dominate otherwise)")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
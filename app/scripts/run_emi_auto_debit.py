@@ -0,0 +1,34 @@
+"""Scheduled EMI auto-debit worker.
+
+Run one process per partition, e.g. from cron at month end:
+
+    python -m app.scripts.run_emi_auto_debit --partition 0 --partitions 4
+"""
+import argparse
+import asyncio
+
+from ..services.emi_batch_service import run_emi_auto_debit
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect due EMIs by debiting customer bank accounts")
+    parser.add_argument("--partition", type=int, default=0, help="partition handled by this worker (customer_id % partitions)")
+    parser.add_argument("--partitions", type=int, default=1, help="total number of workers")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+    report = asyncio.run(run_emi_auto_debit(args.partition, args.partitions, args.batch_size))
+    print(
+        f"partition {report['partition']}/{report['partitions']}: "
+        f"collected {report['collected']} EMIs ({report['amount_collected']}), "
+        f"insufficient balance {report['insufficient_balance']}, no account {report['no_account']}, "
+        f"{report['loans_per_sec']} loans/sec"
+    )
+    if report["recovered_batches"]:
+        print(
+            f"settled {report['recovered_batches']} unfinished batch(es) from an earlier run, "
+            f"{report['recovered_reverted']} EMI(s) put back as not collected"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,12 @@
 from datetime import datetime
 from ..database.mongo import get_db
 from ..core.config import settings
+from ..core.tracing import traced
 from ..utils.sequences import next_account_number
-from ..utils.sequences import next_transaction_id
+from .ledger_service import ledger_session, credit, record_transaction
+from .summary_service import summary_set_balance
 
+@traced
 async def auto_create_account_for(customer_id: str) -> dict:
     db = await get_db()
     account_number = await next_account_number()
@@ -20,27 +23,20 @@ async def auto_create_account_for(customer_id: str) -> dict:
     out = {"_id": str(res.inserted_id), **doc}
     return normalize_doc(out)
 
+@traced
 async def add_money(customer_id: str, amount: float) -> dict:
-    db = await get_db()
-    acc = await db.bank_accounts.find_one({"customer_id": customer_id})
-    if not acc:
-        raise Exception("Account not found")
-    new_balance = float(acc.get("balance", 0)) + amount
-    await db.bank_accounts.update_one({"_id": acc["_id"]}, {"$set": {"balance": new_balance}})
-    txn = {
-        "customer_id": customer_id,
-        "loan_id": None,
-        "loan_type": None,
-        "type": "credit",
-        "amount": amount,
-        "balance_after": new_balance,
-        "created_at": datetime.utcnow(),
-    }
-    tid = await next_transaction_id()
-    txn["_id"] = tid
-    txn["transaction_id"] = tid
-    res = await db.transactions.insert_one(txn)
-    from ..utils.serializers import normalize_doc
-    out = {"_id": tid, **txn}
-    n = normalize_doc(out)
-    return {"transaction_id": n.get("_id"), "balance": new_balance}
+    async with ledger_session() as session:
+        acc = await credit(customer_id, amount, session=session)
+        new_balance = float(acc["balance"])
+        txn = {
+            "customer_id": customer_id,
+            "loan_id": None,
+            "loan_type": None,
+            "type": "credit",
+            "amount": amount,
+            "balance_after": new_balance,
+            "created_at": datetime.utcnow(),
+        }
+        tid = await record_transaction(txn, session=session)
+        await summary_set_balance(customer_id, new_balance, session=session)
+    return {"transaction_id": tid, "balance": new_balance}
@@ -1,12 +1,20 @@
 
+from ..core.tracing import traced
 from ..database.mongo import get_db
+from .loan_repository import page_loans
+from ..schemas.loan import LoanOut
+from ..utils.projections import projection_for
 
-async def list_pending_admin_approvals():
-    db = await get_db()
-    loans = await db.personal_loans.find({"status": "pending_admin_approval"}).to_list(length=200)
-    loans += await db.vehicle_loans.find({"status": "pending_admin_approval"}).to_list(length=200)
-    from ..utils.serializers import normalize_doc
-    return [normalize_doc(l) for l in loans]
+APPROVAL_SORT = [("applied_at", 1), ("_id", 1)]
+APPROVAL_FIELDS = projection_for(
+    LoanOut, "loan_id", "customer_id", "full_name", "loan_purpose", "cibil_score_at_apply",
+    "max_eligible_amount", "manager_id", "verification_id", sort=APPROVAL_SORT,
+)
+
+@traced
+async def list_pending_admin_approvals(cursor: str | None = None, limit: int | None = None):
+    # work queue: oldest application first
+    return await page_loans({"status": "pending_admin_approval"}, APPROVAL_SORT, cursor, limit, APPROVAL_FIELDS)
 
 
 from datetime import datetime
@@ -15,6 +23,7 @@ from ..core.security import hash_password
 from ..models.enums import Roles
 from ..utils.sequences import next_customer_id
 
+@traced
 async def create_staff_user(email: str, full_name: str, password: str, role: str):
     if role not in [Roles.MANAGER, Roles.VERIFICATION]:
         raise HTTPException(status_code=400, detail="Invalid role")
@@ -25,7 +34,7 @@ async def create_staff_user(email: str, full_name: str, password: str, role: str
     doc = {
         "full_name": full_name,
         "email": email,
-        "password": hash_password(password),
+        "password": await hash_password(password),
         "role": role,
         "_id": await next_customer_id(),
         "is_active": True,
@@ -3,11 +3,13 @@ from datetime import datetime
 from bson import ObjectId
 from fastapi import HTTPException
 from ..database.mongo import get_db
-from ..core.security import hash_password, verify_password, create_access_token
+from ..core.security import hash_password, verify_password, needs_rehash, create_access_token
 from ..core.config import settings
+from ..core.tracing import traced
 from ..models.enums import Roles
 from ..utils.sequences import next_customer_id
 
+@traced
 async def register_customer(payload: dict) -> dict:
     db = await get_db()
     existing = await db.users.find_one({"email": payload["email"]})
@@ -19,7 +21,7 @@ async def register_customer(payload: dict) -> dict:
     user_doc = {
         "full_name": payload["full_name"],
         "email": payload["email"],
-        "password": hash_password(payload["password"]),
+        "password": await hash_password(payload["password"]),
         "phone": payload.get("phone"),
         "dob": payload.get("dob"),
         "gender": payload.get("gender"),
@@ -37,12 +39,19 @@ async def register_customer(payload: dict) -> dict:
     out = {"_id": user_id, **user_doc}
     return normalize_doc(out)
 
+@traced
 async def login(email: str, password: str) -> dict:
     db = await get_db()
     user = await db.users.find_one({"email": email})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    if not verify_password(password, user.get("password", "")):
+    if not await verify_password(password, user.get("password", "")):
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if needs_rehash(user["password"]):
+        # the configured cost changed since this hash was made; upgrade it while we have the password
+        try:
+            await db.users.update_one({"_id": user["_id"]}, {"$set": {"password": await hash_password(password)}})
+        except HTTPException:
+            pass  # pool saturated; the upgrade is retried on a later login
     token = create_access_token({"user_id": str(user["_id"]), "role": user["role"]})
     return {"access_token": token, "token_type": "bearer", "role": user["role"], "user_id": str(user["_id"]) }
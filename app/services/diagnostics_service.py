@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from ..core import diagnostics
+from ..core.config import settings
+from ..core.tracing import traced
+from ..database.indexes import _plan_stages
+from ..database.mongo import get_db
+
+logger = logging.getLogger(__name__)
+
+_EXEC_FIELDS = ("nReturned", "executionTimeMillis", "totalKeysExamined", "totalDocsExamined")
+
+
+def _find_key(doc, key):
+    """First value stored under `key` anywhere in an explain document (aggregate nests it per stage)."""
+    if isinstance(doc, dict):
+        if key in doc:
+            return doc[key]
+        values = doc.values()
+    elif isinstance(doc, list):
+        values = doc
+    else:
+        return None
+    for value in values:
+        found = _find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def summarize_explain(result: dict) -> dict:
+    stats = _find_key(result, "executionStats") or {}
+    return {
+        "stages": _plan_stages(_find_key(result, "winningPlan")),
+        **{field: stats.get(field) for field in _EXEC_FIELDS},
+    }
+
+
+@traced
+async def capture_explains(top: int | None = None, refresh: bool = False) -> list[dict]:
+    """Explain the `top` slowest shapes seen so far that have no explain yet (all of them with `refresh`)."""
+    db = await get_db()
+    captured = []
+    for stats in diagnostics.slowest_shapes(top or settings.DIAGNOSTICS_EXPLAIN_TOP):
+        if stats.sample is None or (stats.explain is not None and not refresh):
+            continue
+        try:
+            result = await db.command({"explain": stats.sample, "verbosity": "executionStats"})
+            stats.explain = summarize_explain(result)
+        except Exception as exc:
+            stats.explain = {"error": str(exc)}
+        captured.append(stats.as_dict())
+    return captured
+
+
+async def poll_explains():
+    while True:
+        await asyncio.sleep(settings.DIAGNOSTICS_EXPLAIN_INTERVAL_SECONDS)
+        if not diagnostics.config["enabled"]:
+            continue
+        try:
+            await capture_explains()
+        except Exception:
+            logger.exception("capturing explain output for slow query shapes failed")
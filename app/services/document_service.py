@@ -1,12 +1,48 @@
-"""Service to handle document uploads and storage."""
+"""Service to handle document uploads and storage.
+
+Documents live in a content-addressed store: each distinct file is written once to
+`uploads/blobs/ab/cd/<sha256>` (with `.gz` when stored compressed), and records point at it
+with a `sha256:<hex>` reference. `document_blobs` keeps one document per blob with its
+reference count; `document_refs` maps each upload slot (e.g. `kyc/12/pan_card.pdf`) to the blob
+it currently holds, so re-uploading a file swaps references instead of copying bytes.
+Unreferenced blobs are deleted by `sweep_document_blobs` once they have been unreferenced for
+DOCUMENT_BLOB_GRACE_SECONDS. Paths stored before the blob store existed still resolve.
+
+Every upload is checked by `utils/pdf.inspect_pdf` in a process pool before it is stored;
+files that fail are rejected with 400 and never reach the verification queue.
+"""
+import asyncio
+import gzip
+import hashlib
+import multiprocessing
 import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
-from fastapi import HTTPException, UploadFile
+from typing import NamedTuple
+from fastapi import HTTPException, Response, UploadFile
+from pymongo import ReturnDocument
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from ..core.config import settings
+from ..core.tracing import traced
+from ..database.mongo import get_db
+from ..utils.cache import TTLCache
+from ..utils.pdf import inspect_pdf
 
 
 # Base uploads directory
 UPLOADS_DIR = Path(__file__).parent.parent.parent / "uploads"
+BLOBS_DIR = UPLOADS_DIR / "blobs"
+TMP_DIR = BLOBS_DIR / "tmp"
 ALLOWED_EXTENSIONS = {".pdf"}
+REF_PREFIX = "sha256:"
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+_BYTE_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
 
 
 def ensure_upload_dir(subdir: str) -> Path:
@@ -16,9 +52,178 @@ def ensure_upload_dir(subdir: str) -> Path:
     return target_dir
 
 
-async def upload_document(file: UploadFile, subdir: str, filename: str) -> str:
+def blob_path(sha256: str, compressed: bool = False) -> Path:
+    return BLOBS_DIR / sha256[:2] / sha256[2:4] / (sha256 + (".gz" if compressed else ""))
+
+
+def _blob_files(sha256: str) -> list[tuple[str | None, Path]]:
+    """(compression, path) for each way a blob can be stored, in the order uploads and sweeps visit them."""
+    return [(None, blob_path(sha256)), ("gzip", blob_path(sha256, True))]
+
+
+def _write_chunk(tmp, digest, chunk: bytes):
+    digest.update(chunk)
+    tmp.write(chunk)
+
+
+def _finish(tmp):
+    tmp.flush()
+    os.fsync(tmp.fileno())
+    tmp.close()
+
+
+def _discard(tmp):
+    tmp.close()
+    Path(tmp.name).unlink(missing_ok=True)
+
+
+async def _stream_to_temp(file: UploadFile, target_dir: Path) -> tuple[Path, str, int]:
+    """Copy the upload chunk by chunk into a temp file in `target_dir`; return (path, sha256, size).
+
+    Disk writes and hashing run in the threadpool, and at most one chunk is held in memory,
+    so neither file size nor the number of concurrent uploads blocks the event loop.
+    """
+    tmp = await run_in_threadpool(
+        tempfile.NamedTemporaryFile, dir=target_dir, prefix=".upload-", suffix=".part", delete=False
+    )
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > settings.UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"File exceeds {settings.UPLOAD_MAX_BYTES} bytes")
+            await run_in_threadpool(_write_chunk, tmp, digest, chunk)
+        if not size:
+            raise HTTPException(status_code=400, detail="File is empty")
+        await run_in_threadpool(_finish, tmp)
+    except BaseException:
+        await run_in_threadpool(_discard, tmp)
+        raise
+    return Path(tmp.name), digest.hexdigest(), size
+
+
+# sha256 -> inspect_pdf result, so a given file is only validated once per process; accepted
+# results are also stored on the blob document and shared with other workers through Mongo
+validation_cache = TTLCache(settings.PDF_VALIDATION_CACHE_MAX_ENTRIES, settings.PDF_VALIDATION_CACHE_TTL_SECONDS)
+# sha256 of files whose check timed out, so re-uploading one fails fast instead of tying up a worker
+timed_out_cache = TTLCache(settings.PDF_VALIDATION_CACHE_MAX_ENTRIES, settings.PDF_VALIDATION_TIMEOUT_CACHE_SECONDS)
+_pdf_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        # spawn, not fork: the parent runs an event loop and Motor's threads
+        _pdf_pool = ProcessPoolExecutor(settings.PDF_VALIDATION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pdf_pool
+
+
+def start_pdf_pool():
+    """Spawn the workers now, so the first upload does not pay for interpreter start-up."""
+    _get_pdf_pool().submit(int)
+
+
+def _recycle_pdf_pool(pool: ProcessPoolExecutor):
+    """Replace `pool` and kill its workers; a timed-out inspection would otherwise keep running."""
+    global _pdf_pool
+    if _pdf_pool is not pool:
+        return  # already replaced by another timed-out upload
+    _pdf_pool = None
+    # the executor has no public way to stop a running call before 3.14's terminate_workers()
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def shutdown_pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+
+@traced
+async def validate_pdf(db, path: Path, sha256: str) -> dict:
+    """Check the uploaded file at `path` in the process pool, unless this content was checked before."""
+    result = validation_cache.get(sha256)
+    if result is not None:
+        return result
+    if timed_out_cache.get(sha256):
+        return {"ok": False, "reason": "validation timed out", "pages": None}
+    blob = await db.document_blobs.find_one({"_id": sha256, "validation.ok": True}, {"validation": 1})
+    if blob:
+        result = blob["validation"]
+    else:
+        for attempt in range(2):
+            pool = _get_pdf_pool()
+            future = asyncio.get_running_loop().run_in_executor(pool, inspect_pdf, str(path), settings.PDF_MAX_PAGES)
+            try:
+                result = await asyncio.wait_for(future, settings.PDF_VALIDATION_TIMEOUT_SECONDS)
+                break
+            except asyncio.TimeoutError:
+                # the worker is killed with its pool; short-lived negative entry, not a verdict
+                _recycle_pdf_pool(pool)
+                timed_out_cache.set(sha256, True)
+                return {"ok": False, "reason": "validation timed out", "pages": None}
+            except BrokenProcessPool:
+                # another upload's check timed out and took this pool down; retry once on a fresh one
+                if attempt:
+                    return {"ok": False, "reason": "validation interrupted, try again", "pages": None}
+    validation_cache.set(sha256, result)
+    return result
+
+
+def _compress(src: Path) -> Path | None:
+    """gzip `src` next to itself; return the compressed file if it is worth keeping."""
+    dst = src.with_suffix(".gz")
+    with open(src, "rb") as fin, gzip.open(dst, "wb", compresslevel=6) as fout:
+        shutil.copyfileobj(fin, fout, settings.UPLOAD_CHUNK_SIZE)
+    if dst.stat().st_size <= src.stat().st_size * settings.DOCUMENT_COMPRESSION_MAX_RATIO:
+        return dst
+    dst.unlink()
+    return None
+
+
+def _store_blob(tmp: Path, sha256: str, revived: bool) -> tuple[Path, str | None]:
+    """Move a finished temp file into the store unless the blob is already there.
+
+    A `revived` blob had no references before this upload, so a sweep may be deleting the
+    stored copy right now: write it again rather than trusting what is on disk.
+    """
+    if not revived:
+        for compression, existing in _blob_files(sha256):
+            if existing.exists():
+                tmp.unlink()
+                return existing, compression
+    compression, target = None, blob_path(sha256)
+    if settings.DOCUMENT_COMPRESSION:
+        packed = _compress(tmp)
+        if packed:
+            tmp.unlink()
+            tmp, compression, target = packed, "gzip", blob_path(sha256, True)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp, target)
+    if revived:
+        # a copy stored the other way may be mid-sweep; later uploads must not find and reuse it
+        for _, other in _blob_files(sha256):
+            if other != target:
+                other.unlink(missing_ok=True)
+    return target, compression
+
+
+def _release_update() -> list:
+    return [{"$set": {
+        "refcount": {"$subtract": ["$refcount", 1]},
+        "released_at": {"$cond": [{"$lte": ["$refcount", 1]}, "$$NOW", None]},
+    }}]
+
+
+@traced
+async def upload_document(file: UploadFile, subdir: str, filename: str) -> dict:
     """
-    Upload a PDF document and return the file path (relative).
+    Stream a PDF document into the blob store and point the slot `subdir/filename` at it.
     
     Args:
         file: UploadFile from FastAPI
@@ -26,7 +231,7 @@ async def upload_document(file: UploadFile, subdir: str, filename: str) -> str:
         filename: desired filename (e.g., 'pan_card.pdf', 'pay_slip.pdf')
     
     Returns:
-        Relative file path suitable for storage in DB
+        {"file_path": "sha256:<hex>" reference for storage in DB, "sha256": hex digest, "size": bytes, "pages": page count or None}
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="File has no name")
@@ -36,29 +241,276 @@ async def upload_document(file: UploadFile, subdir: str, filename: str) -> str:
     if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"Only PDF files allowed; got {file_ext}")
     
-    # Ensure directory exists
-    target_dir = ensure_upload_dir(subdir)
+    db = await get_db()
+    tmp_dir = await run_in_threadpool(ensure_upload_dir, TMP_DIR.relative_to(UPLOADS_DIR))
+    tmp_path, sha256, size = await _stream_to_temp(file, tmp_dir)
+    try:
+        validation = await validate_pdf(db, tmp_path, sha256)
+    except BaseException:
+        await run_in_threadpool(tmp_path.unlink, missing_ok=True)
+        raise
+    if not validation["ok"]:
+        await run_in_threadpool(tmp_path.unlink, missing_ok=True)
+        raise HTTPException(status_code=400, detail=f"Invalid PDF: {validation['reason']}")
     
-    # Save file
-    file_path = target_dir / filename
+    # take the reference before the file lands, so a sweep can never remove a blob being stored
+    now = datetime.utcnow()
+    before = await db.document_blobs.find_one_and_update(
+        {"_id": sha256},
+        {
+            "$inc": {"refcount": 1},
+            "$set": {"released_at": None, "validation": validation},
+            "$setOnInsert": {"size": size, "created_at": now},
+        },
+        {"refcount": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    revived = before is None or before.get("refcount", 0) <= 0
     try:
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
+        path, compression = await run_in_threadpool(_store_blob, tmp_path, sha256, revived)
     except Exception as e:
+        await run_in_threadpool(tmp_path.unlink, missing_ok=True)
+        await db.document_blobs.update_one({"_id": sha256}, _release_update())
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    stored = await run_in_threadpool(path.stat)
+    await db.document_blobs.update_one(
+        {"_id": sha256}, {"$set": {"stored_size": stored.st_size, "compression": compression}}
+    )
     
-    # Return relative path for DB storage
-    relative_path = str(file_path.relative_to(UPLOADS_DIR.parent))
-    return relative_path
+    prev = await db.document_refs.find_one_and_update(
+        {"_id": f"{subdir}/{filename}"},
+        {"$set": {"sha256": sha256, "updated_at": now}},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    # the slot already held this blob (a re-upload) or held another one: either way one reference goes
+    previous = prev.get("sha256") if prev else None
+    if previous:
+        await db.document_blobs.update_one({"_id": previous}, _release_update())
+    return {"file_path": REF_PREFIX + sha256, "sha256": sha256, "size": size, "pages": validation["pages"]}
 
 
 def get_document_path(doc_path: str) -> Path:
     """
-    Get full file path from stored relative path.
-    Useful for serving/downloading files.
+    Get full file path from a stored `sha256:` reference or legacy relative path.
+    Useful for serving/downloading files; compressed blobs end in `.gz`.
     """
+    if doc_path.startswith(REF_PREFIX):
+        sha256 = doc_path[len(REF_PREFIX):]
+        if _SHA256.fullmatch(sha256):
+            for _, full_path in _blob_files(sha256):
+                if full_path.exists():
+                    return full_path
+        raise HTTPException(status_code=404, detail="Document not found")
     full_path = UPLOADS_DIR.parent / doc_path
     if not full_path.exists():
         raise HTTPException(status_code=404, detail="Document not found")
     return full_path
+
+
+def _gunzip_chunks(path: Path):
+    with gzip.open(path, "rb") as f:
+        while chunk := f.read(settings.UPLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+class DocumentInfo(NamedTuple):
+    path: Path
+    size: int
+    mtime: float
+    etag: str
+    encoding: str | None  # "gzip" for compressed blobs
+
+
+# stored reference -> DocumentInfo, so repeated views skip resolving and the stat; a re-upload
+# stores a new reference, so every worker sees it without invalidation
+document_cache = TTLCache(settings.DOCUMENT_CACHE_MAX_ENTRIES, settings.DOCUMENT_CACHE_TTL_SECONDS)
+
+
+def document_info(doc_path: str) -> DocumentInfo:
+    """Resolve and stat a stored document (blocking; run it in the threadpool)."""
+    path = get_document_path(doc_path)
+    st = path.stat()
+    if doc_path.startswith(REF_PREFIX):
+        etag = f'"{doc_path[len(REF_PREFIX):]}"'
+    else:
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    return DocumentInfo(path, st.st_size, st.st_mtime, etag, "gzip" if path.suffix == ".gz" else None)
+
+
+async def cached_document_info(doc_path: str) -> DocumentInfo:
+    info = document_cache.get(doc_path)
+    if info is None:
+        info = await run_in_threadpool(document_info, doc_path)
+        document_cache.set(doc_path, info)
+    return info
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _not_modified(headers, info: DocumentInfo) -> bool:
+    if "if-none-match" in headers:
+        return _etag_matches(headers["if-none-match"], info.etag)
+    if "if-modified-since" in headers:
+        try:
+            return int(info.mtime) <= parsedate_to_datetime(headers["if-modified-since"]).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None | bool:
+    """(start, end) inclusive for a single `bytes=` range, None to ignore it, False if unsatisfiable."""
+    # other units, malformed values and multipart ranges get the whole file
+    m = _BYTE_RANGE.fullmatch(header.strip())
+    if not m or not (m[1] or m[2]):
+        return None
+    if not m[1]:
+        start, end = max(size - int(m[2]), 0), size - 1
+    else:
+        start, end = int(m[1]), min(int(m[2]), size - 1) if m[2] else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+class DocumentResponse(Response):
+    """Download of a stored document with conditional GET, a single byte range and zero-copy sends.
+
+    ETag/If-None-Match (or Last-Modified/If-Modified-Since) answer 304 with no disk read. A
+    single `Range: bytes=` is served as 206. Bodies go out through the ASGI
+    `http.response.zerocopysend` or `http.response.pathsend` extension when the server offers
+    one, else in chunks read in the threadpool. Compressed blobs are sent gzip-encoded to
+    clients that accept it and decompressed otherwise; they are not range-capable.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, info: DocumentInfo, filename: str, request_headers):
+        self.info = info
+        self.start, self.length = 0, info.size
+        self.gunzip = False
+        self.status_code = 200
+        headers = {
+            "etag": info.etag,
+            "last-modified": formatdate(info.mtime, usegmt=True),
+            "cache-control": "private, no-cache",
+            "content-disposition": f'attachment; filename="{filename}"',
+        }
+        if info.encoding:
+            headers["vary"] = "Accept-Encoding"
+            headers["accept-ranges"] = "none"
+            if "gzip" in request_headers.get("accept-encoding", ""):
+                headers["content-encoding"] = info.encoding
+            else:
+                self.gunzip = True
+        else:
+            headers["accept-ranges"] = "bytes"
+
+        if _not_modified(request_headers, info):
+            self.status_code, self.length = 304, 0
+        elif not info.encoding and "range" in request_headers and (
+            "if-range" not in request_headers or request_headers["if-range"] == info.etag
+        ):
+            byte_range = _parse_range(request_headers["range"], info.size)
+            if byte_range is False:
+                self.status_code, self.length = 416, 0
+                headers["content-range"] = f"bytes */{info.size}"
+            elif byte_range:
+                start, end = byte_range
+                self.status_code, self.start, self.length = 206, start, end - start + 1
+                headers["content-range"] = f"bytes {start}-{end}/{info.size}"
+        # a 304 has no body to describe, so it carries no content-length (as Starlette's FileResponse)
+        if not self.gunzip and self.status_code != 304:
+            headers["content-length"] = str(self.length)
+        self.media_type = "application/pdf" if self.status_code in (200, 206) else None
+        self.background = None
+        self.init_headers(headers)
+
+    async def _send_file(self, send, extensions: dict):
+        if "http.response.zerocopysend" in extensions:
+            f = await run_in_threadpool(open, self.info.path, "rb")
+            try:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": self.start, "count": self.length})
+            finally:
+                await run_in_threadpool(f.close)
+            return
+        if "http.response.pathsend" in extensions and self.length == self.info.size:
+            await send({"type": "http.response.pathsend", "path": str(self.info.path)})
+            return
+        f = await run_in_threadpool(open, self.info.path, "rb")
+        try:
+            await run_in_threadpool(f.seek, self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await run_in_threadpool(f.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await run_in_threadpool(f.close)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.status_code in (304, 416) or not self.length:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif self.gunzip:
+            async for chunk in iterate_in_threadpool(_gunzip_chunks(self.info.path)):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            await self._send_file(send, scope.get("extensions") or {})
+
+
+def _set_aside_blob(sha256: str) -> list[tuple[Path, Path]]:
+    """Rename a blob's files out of the way; returns (original, renamed) pairs."""
+    moved = []
+    for _, path in _blob_files(sha256):
+        aside = path.with_name(path.name + ".sweep")
+        try:
+            os.replace(path, aside)
+        except FileNotFoundError:
+            continue
+        moved.append((path, aside))
+    return moved
+
+
+def _finish_sweep(moved: list[tuple[Path, Path]], restore: bool) -> int:
+    freed = 0
+    for path, aside in moved:
+        if restore:
+            os.replace(aside, path)
+        else:
+            freed += aside.stat().st_size
+            aside.unlink()
+    return freed
+
+
+@traced
+async def sweep_document_blobs(grace_seconds: int | None = None) -> dict:
+    """Delete blobs nobody has referenced for `grace_seconds` (default DOCUMENT_BLOB_GRACE_SECONDS)."""
+    db = await get_db()
+    grace = settings.DOCUMENT_BLOB_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    filt = {"refcount": {"$lte": 0}, "released_at": {"$lt": cutoff}}
+    swept, freed = 0, 0
+    async for blob in db.document_blobs.find(filt, {"_id": 1}):
+        # the conditional delete loses to any upload that re-referenced the blob meanwhile
+        res = await db.document_blobs.delete_one({"_id": blob["_id"], **filt})
+        if not res.deleted_count:
+            continue
+        # an upload that re-created the record after the delete rewrites the file, but may do so
+        # before we get to it: set the files aside and put them back if the blob is in use again
+        moved = await run_in_threadpool(_set_aside_blob, blob["_id"])
+        revived = await db.document_blobs.find_one({"_id": blob["_id"], "refcount": {"$gt": 0}}, {"_id": 1})
+        freed += await run_in_threadpool(_finish_sweep, moved, revived is not None)
+        if revived is None:
+            swept += 1
+    return {"swept": swept, "bytes_freed": freed}
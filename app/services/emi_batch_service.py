@@ -0,0 +1,230 @@
+
+import time
+from datetime import datetime
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from ..core.config import settings
+from ..core.tracing import traced
+from ..database.mongo import get_db
+from ..models.enums import LoanCollection, LoanStatus
+from ..utils.batching import iter_batches
+from ..utils.dates import next_month_date
+from ..utils.sequences import reserve_sequence
+from ..utils.cibil import cibil_change_pipeline
+from .loan_service import emi_paid_update, emi_reverted_update
+from .summary_service import emi_paid_summary_update
+
+LOAN_FIELDS = {"customer_id": 1, "loan_id": 1, "emi_per_month": 1, "remaining_tenure": 1, "next_emi_date": 1}
+
+
+def _due_filter(as_of: datetime, partition: int, partitions: int) -> dict:
+    filt = {"status": LoanStatus.ACTIVE, "next_emi_date": {"$lte": as_of}}
+    if partitions > 1:
+        filt["customer_id"] = {"$mod": [partitions, partition]}
+    return filt
+
+
+async def _collect_batch(db, coll_name: str, loans: list, batch: dict, as_of: datetime, report: dict):
+    loans_by_customer: dict = {}
+    for loan in loans:
+        loans_by_customer.setdefault(loan["customer_id"], []).append(loan)
+    accounts = await db.bank_accounts.find(
+        {"customer_id": {"$in": list(loans_by_customer)}}, {"customer_id": 1, "balance": 1}
+    ).to_list(length=None)
+    accounts = {a["customer_id"]: a for a in accounts}
+
+    # charge each customer's loans in order while the balance covers the next EMI
+    planned = []
+    for cid, customer_loans in loans_by_customer.items():
+        acc = accounts.get(cid)
+        if not acc:
+            report["no_account"] += len(customer_loans)
+            continue
+        available = float(acc.get("balance", 0))
+        for loan in customer_loans:
+            emi = float(loan["emi_per_month"])
+            if available < emi:
+                report["insufficient_balance"] += 1
+                continue
+            available -= emi
+            planned.append({**loan, "account_id": acc["_id"]})
+    if not planned:
+        return
+
+    # journal the plan before anything changes, so a crash at any later step can be settled
+    tag = batch["_id"]
+    batch = {**batch, "collection": coll_name, "loans": planned, "created_at": datetime.utcnow()}
+    await db.emi_auto_debit_batches.insert_one(batch)
+
+    # advance the loans first, each only if it is still due and unpaid since we read it, so an EMI
+    # paid meanwhile through pay_emi (or by an earlier run) is never advanced or charged again
+    await db[coll_name].bulk_write([
+        UpdateOne(
+            {"_id": loan["_id"], "status": LoanStatus.ACTIVE, "next_emi_date": {"$lte": as_of}, "remaining_tenure": loan["remaining_tenure"]},
+            [*emi_paid_update(float(loan["emi_per_month"]), next_month_date(batch["created_at"])), {"$set": {"last_auto_debit": tag}}],
+        )
+        for loan in planned
+    ], ordered=False)
+    advanced_ids = await _advanced_ids(db, batch)
+    report["changed_concurrently"] += len(planned) - len(advanced_ids)
+
+    charges = {}
+    for loan in planned:
+        if loan["_id"] in advanced_ids:
+            acc_id, total = charges.get(loan["customer_id"], (loan["account_id"], 0.0))
+            charges[loan["customer_id"]] = (acc_id, total + float(loan["emi_per_month"]))
+    if charges:
+        # the balance guard keeps a concurrent withdrawal from overdrawing; the tag, stamped with the
+        # balance it left, tells us (or a later recovery) which debits landed
+        await db.bank_accounts.bulk_write([
+            UpdateOne(
+                {"_id": acc_id, "balance": {"$gte": total}},
+                [
+                    {"$set": {"balance": {"$subtract": ["$balance", total]}}},
+                    {"$set": {"last_auto_debit": {"tag": tag, "balance": "$balance"}}},
+                ],
+            )
+            for acc_id, total in charges.values()
+        ], ordered=False)
+    report["insufficient_balance"] += await _settle_batch(db, batch, report, advanced_ids)
+
+
+async def _advanced_ids(db, batch: dict) -> set:
+    return {l["_id"] for l in await db[batch["collection"]].find(
+        {"_id": {"$in": [l["_id"] for l in batch["loans"]]}, "last_auto_debit": batch["_id"]}, {"_id": 1}
+    ).to_list(length=None)}
+
+
+async def _settle_batch(db, batch: dict, report: dict, advanced_ids: set | None = None) -> int:
+    """Finish a journaled batch from whatever state its loans and accounts are in; return the loans put back.
+
+    Loans advanced for a customer whose debit did not land are reverted. For debits that landed,
+    the ledger rows are inserted under the transaction ids recorded in the journal and the CIBIL
+    and summary updates are applied once per batch tag, so settling the same batch again after a
+    crash changes nothing twice. The journal entry is removed last.
+    """
+    tag, coll_name = batch["_id"], batch["collection"]
+    if advanced_ids is None:
+        advanced_ids = await _advanced_ids(db, batch)
+    charged: dict = {}
+    for loan in batch["loans"]:
+        if loan["_id"] in advanced_ids:
+            charged.setdefault(loan["customer_id"], []).append(loan)
+    debited = {}
+    if charged:
+        debited = {a["customer_id"]: float(a["last_auto_debit"]["balance"]) for a in await db.bank_accounts.find(
+            {"_id": {"$in": list({l[0]["account_id"] for l in charged.values()})}, "last_auto_debit.tag": tag},
+            {"customer_id": 1, "last_auto_debit": 1},
+        ).to_list(length=None)}
+    undebited = [loan for cid, loans in charged.items() if cid not in debited for loan in loans]
+    if undebited:
+        await db[coll_name].bulk_write([
+            UpdateOne({"_id": loan["_id"], "last_auto_debit": tag}, emi_reverted_update(float(loan["emi_per_month"]), loan["next_emi_date"]))
+            for loan in undebited
+        ], ordered=False)
+
+    if debited:
+        paid = [loan for loan in batch["loans"] if loan["customer_id"] in debited and loan["_id"] in advanced_ids]
+        next_tid = batch.get("txn_start")
+        if next_tid is None:
+            next_tid = await reserve_sequence("transaction_id", len(paid))
+            await db.emi_auto_debit_batches.update_one({"_id": tag}, {"$set": {"txn_start": next_tid}})
+        loan_type = "personal" if coll_name == LoanCollection.PERSONAL.value else "vehicle"
+        # running balance per customer, starting from before this batch's debit
+        balances = {cid: balance + sum(float(l["emi_per_month"]) for l in charged[cid]) for cid, balance in debited.items()}
+        txns, kyc_ops, summary_ops = [], [], []
+        for loan in paid:
+            cid, emi = loan["customer_id"], float(loan["emi_per_month"])
+            balances[cid] -= emi
+            txns.append({
+                "_id": next_tid,
+                "transaction_id": next_tid,
+                "customer_id": cid,
+                "loan_id": loan.get("loan_id") or (int(loan["_id"]) if isinstance(loan.get("_id"), int) else str(loan["_id"])),
+                "loan_type": loan_type,
+                "type": "emi",
+                "amount": emi,
+                "balance_after": balances[cid],
+                "created_at": batch["created_at"],
+            })
+            next_tid += 1
+            report["collected"] += 1
+            report["amount_collected"] += emi
+        for cid, balance in debited.items():
+            loans = charged[cid]
+            total = sum(float(l["emi_per_month"]) for l in loans)
+            completed = sum(1 for l in loans if int(l.get("remaining_tenure") or 0) <= 1)
+            # KYC: increase cibil +1 per EMI paid, max 850
+            kyc_ops.append(UpdateOne(
+                {"customer_id": cid, "last_auto_debit": {"$ne": tag}},
+                [*cibil_change_pipeline(len(loans)), {"$set": {"last_auto_debit": tag}}],
+            ))
+            summary_ops.append(UpdateOne(
+                {"_id": cid, "last_auto_debit": {"$ne": tag}},
+                [*emi_paid_summary_update(balance, len(loans), total, completed), {"$set": {"last_auto_debit": tag}}],
+            ))
+        try:
+            await db.transactions.insert_many(txns, ordered=False)
+        except BulkWriteError as e:
+            # rows inserted before a crash keep their ids; anything else is a real failure
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+        await db.kyc_details.bulk_write(kyc_ops, ordered=False)
+        await db.customer_summary.bulk_write(summary_ops, ordered=False)
+    await db.emi_auto_debit_batches.delete_one({"_id": tag})
+    return len(undebited)
+
+
+@traced
+async def run_emi_auto_debit(partition: int = 0, partitions: int = 1, batch_size: int | None = None) -> dict:
+    """Collect every due EMI on ACTIVE loans by debiting the customer's bank account.
+
+    Loans are split by `customer_id % partitions`, so workers running different partitions never
+    touch the same account and can run side by side. Each batch costs a fixed number of round
+    trips: account read, journal insert, guarded loan update, loan confirmation, guarded debit,
+    debit confirmation, transaction id reservation, transaction insert, CIBIL and summary
+    updates and journal removal.
+
+    Loans are advanced before any money moves, and only loans still due and unpaid since they
+    were read are advanced; accounts are then debited for exactly those loans, and loans whose
+    debit did not land are put back. Each batch is journaled in `emi_auto_debit_batches` until it
+    is fully recorded, and a run first settles the batches its partition left unfinished: EMIs
+    advanced but never debited are put back (and collected by this run if still due), debits
+    without ledger rows get them. A crash therefore never leaves an EMI marked paid without the
+    money, or money taken without a transaction.
+    """
+    if partitions < 1 or not 0 <= partition < partitions:
+        raise HTTPException(status_code=400, detail="partition must be in [0, partitions)")
+    db = await get_db()
+    batch_size = batch_size or settings.EMI_AUTO_DEBIT_BATCH_SIZE
+    as_of = datetime.utcnow()
+    report = {
+        "collected": 0, "amount_collected": 0.0, "insufficient_balance": 0, "no_account": 0, "changed_concurrently": 0,
+        "recovered_batches": 0, "recovered_reverted": 0,
+    }
+
+    started = time.perf_counter()
+    async for batch in db.emi_auto_debit_batches.find({"partition": partition, "partitions": partitions}):
+        report["recovered_reverted"] += await _settle_batch(db, batch, report)
+        report["recovered_batches"] += 1
+    scanned = 0
+    for coll_name in [c.value for c in LoanCollection]:
+        cursor = db[coll_name].find(_due_filter(as_of, partition, partitions), LOAN_FIELDS, batch_size=batch_size)
+        batch_no = 0
+        async for loans in iter_batches(cursor, batch_size):
+            scanned += len(loans)
+            batch_no += 1
+            batch = {"_id": f"{as_of.isoformat()}/{partition}/{coll_name}/{batch_no}", "partition": partition, "partitions": partitions}
+            await _collect_batch(db, coll_name, loans, batch, as_of, report)
+    elapsed = time.perf_counter() - started
+    return {
+        **report,
+        "amount_collected": round(report["amount_collected"], 2),
+        "scanned": scanned,
+        "partition": partition,
+        "partitions": partitions,
+        "as_of": as_of,
+        "elapsed_seconds": round(elapsed, 3),
+        "loans_per_sec": round(scanned / elapsed, 1) if elapsed > 0 else 0.0,
+    }
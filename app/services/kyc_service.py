@@ -2,7 +2,15 @@ from datetime import datetime
 from fastapi import HTTPException
 from bson import ObjectId
 from ..database.mongo import get_db
+from ..core.security import invalidate_principal
+from ..core.tracing import traced
 from ..utils.serializers import normalize_doc, normalize_value
+from ..utils.pagination import keyset_filter, page_limit, split_page
+from ..utils.projections import projection_for
+from ..schemas.kyc import KYCOut
+from ..schemas.loan import LoanOut
+from .loan_repository import page_loans
+from .summary_service import summary_kyc_changed
 
 
 def _normalize_customer_id(cid):
@@ -47,6 +55,7 @@ def compute_scores(payload: dict) -> dict:
     }
 
 
+@traced
 async def submit_kyc(customer_id: str, payload: dict) -> dict:
     db = await get_db()
     customer_id = _normalize_customer_id(customer_id)
@@ -71,10 +80,12 @@ async def submit_kyc(customer_id: str, payload: dict) -> dict:
         "verified_at": None,
     }
     res = await db.kyc_details.insert_one(doc)
+    await summary_kyc_changed(customer_id, "pending", None)
     out = {"_id": str(res.inserted_id), **doc}
     return normalize_doc(out)
 
 
+@traced
 async def verify_kyc(customer_id: str, verifier_id: str, approve: bool, scores: dict | None = None, remarks: str | None = None):
     db = await get_db()
     customer_id = _normalize_customer_id(customer_id)
@@ -130,29 +141,50 @@ async def verify_kyc(customer_id: str, verifier_id: str, approve: bool, scores:
 
     # Update user by customer_id (numeric or string), not by ObjectId _id
     await db.users.update_one({"customer_id": customer_id}, {"$set": {"is_kyc_verified": approve}})
+    invalidate_principal(customer_id)
+    await summary_kyc_changed(customer_id, status, cibil)
 
     updated = await db.kyc_details.find_one({"customer_id": customer_id})
     return normalize_doc(updated)
 
 
-async def get_verification_dashboard():
-    db = await get_db()
+KYC_QUEUE_SORT = [("submitted_at", 1), ("_id", 1)]
+# no Aadhaar/PAN numbers on the dashboard; the full record is behind /verification/kyc/{customer_id}
+KYC_QUEUE_FIELDS = projection_for(KYCOut, "customer_id", "full_name", sort=KYC_QUEUE_SORT)
+LOAN_QUEUE_SORT = [("applied_at", 1), ("_id", 1)]
+LOAN_QUEUE_FIELDS = projection_for(LoanOut, "loan_id", "customer_id", "full_name", "verification_id", sort=LOAN_QUEUE_SORT)
 
-    pending_kyc = await db.kyc_details.find({"kyc_status": "pending"}).to_list(length=100)
-    pending_loans = await db.personal_loans.find({"status": "assigned_to_verification"}).to_list(length=100)
-    pending_loans += await db.vehicle_loans.find({"status": "assigned_to_verification"}).to_list(length=100)
 
-    # Stringify ids to avoid JSON issues
-    pending_kyc = [normalize_doc(i) for i in pending_kyc]
-    pending_loans = [normalize_doc(i) for i in pending_loans]
+@traced
+async def get_verification_dashboard(kyc_cursor: str | None = None, loan_cursor: str | None = None, limit: int | None = None):
+    db = await get_db()
 
-    return {"pending_kyc": pending_kyc, "pending_loan_verifications": pending_loans}
+    # both queues oldest first, each paged by its own cursor
+    limit = page_limit(limit)
+    filt = keyset_filter({"kyc_status": "pending"}, KYC_QUEUE_SORT, kyc_cursor)
+    pending_kyc = await db.kyc_details.find(filt, KYC_QUEUE_FIELDS).sort(KYC_QUEUE_SORT).limit(limit + 1).to_list(length=limit + 1)
+    pending_kyc, next_kyc_cursor = split_page(pending_kyc, KYC_QUEUE_SORT, limit)
+    pending_loans = await page_loans({"status": "assigned_to_verification"}, LOAN_QUEUE_SORT, loan_cursor, limit, LOAN_QUEUE_FIELDS)
 
+    return {
+        "pending_kyc": pending_kyc,
+        "pending_loan_verifications": pending_loans["items"],
+        "next_kyc_cursor": next_kyc_cursor,
+        "next_loan_cursor": pending_loans["next_cursor"],
+    }
 
+
+@traced
 async def get_kyc_by_customer(customer_id: str):
     db = await get_db()
     customer_id = _normalize_customer_id(customer_id)
     kyc = await db.kyc_details.find_one({"customer_id": customer_id})
     if not kyc:
         raise HTTPException(status_code=404, detail="KYC not found")
-    return normalize_doc(kyc)
\ No newline at end of file
+    return normalize_doc(kyc)
+
+@traced
+async def attach_kyc_document(customer_id, field: str, ref: str):
+    """Point an existing KYC record's document field at an uploaded blob; a later submit-kyc sets it otherwise."""
+    db = await get_db()
+    await db.kyc_details.update_one({"customer_id": customer_id}, {"$set": {field: ref}})
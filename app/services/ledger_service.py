@@ -0,0 +1,66 @@
+
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from ..core.config import settings
+from ..core.tracing import traced
+from ..database.mongo import get_db, get_client
+from ..utils.sequences import next_transaction_id
+
+
+@asynccontextmanager
+async def ledger_session():
+    """Yield a session running a multi-document transaction, or None when MONGODB_TRANSACTIONS is off."""
+    if not settings.MONGODB_TRANSACTIONS:
+        yield None
+        return
+    async with await get_client().start_session() as session:
+        async with session.start_transaction():
+            yield session
+
+
+@traced
+async def credit(customer_id, amount: float, session=None) -> dict:
+    """Add `amount` to the customer's balance in one round trip and return the updated account."""
+    db = await get_db()
+    acc = await db.bank_accounts.find_one_and_update(
+        {"customer_id": customer_id},
+        {"$inc": {"balance": amount}},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if not acc:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return acc
+
+
+@traced
+async def debit(customer_id, amount: float, session=None) -> dict:
+    """Subtract `amount` only if the balance covers it, and return the updated account.
+
+    The balance check is part of the update filter, so concurrent debits can never overdraw.
+    """
+    db = await get_db()
+    acc = await db.bank_accounts.find_one_and_update(
+        {"customer_id": customer_id, "balance": {"$gte": amount}},
+        {"$inc": {"balance": -amount}},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if not acc:
+        # only the failure path pays for a second read, to tell the two errors apart
+        if not await db.bank_accounts.count_documents({"customer_id": customer_id}, limit=1, session=session):
+            raise HTTPException(status_code=404, detail="Account not found")
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+    return acc
+
+
+@traced
+async def record_transaction(txn: dict, session=None) -> int:
+    """Insert a ledger entry under a new numeric transaction id and return the id."""
+    db = await get_db()
+    tid = await next_transaction_id()
+    txn["_id"] = tid
+    txn["transaction_id"] = tid
+    await db.transactions.insert_one(txn, session=session)
+    return tid
@@ -0,0 +1,112 @@
+"""Single access point for loans stored across `personal_loans` and `vehicle_loans`."""
+from collections import OrderedDict
+from ..core.config import settings
+from ..core.tracing import traced
+from ..database.mongo import get_db
+from ..models.enums import LoanCollection
+from ..utils.id import loan_id_filter
+from ..utils.pagination import Sort, keyset_filter, page_limit, split_page
+
+COLLECTIONS = [c.value for c in LoanCollection]
+
+# loan key (numeric loan_id or ObjectId) -> collection; a loan never changes collection,
+# so entries only leave through LRU eviction
+_registry: "OrderedDict[object, str]" = OrderedDict()
+
+
+def remember(loan_key, collection: str):
+    _registry[loan_key] = collection
+    _registry.move_to_end(loan_key)
+    while len(_registry) > settings.LOAN_REGISTRY_MAX_ENTRIES:
+        _registry.popitem(last=False)
+
+
+def collection_for(loan_key) -> str | None:
+    collection = _registry.get(loan_key)
+    if collection:
+        _registry.move_to_end(loan_key)
+    return collection
+
+
+def _loan_key(loan: dict):
+    return loan.get("loan_id") if loan.get("loan_id") is not None else loan["_id"]
+
+
+def _branch(collection: str, filt: dict, sort: Sort | None, limit: int | None, projection: dict | None) -> list:
+    stages = [{"$match": filt}]
+    # sort/limit straight after the match, so each collection can serve them from its own index
+    if sort:
+        stages.append({"$sort": dict(sort)})
+    if limit:
+        stages.append({"$limit": limit})
+    if projection:
+        stages.append({"$project": projection})
+    stages.append({"$set": {"loan_collection": collection}})
+    return stages
+
+
+def _union_pipeline(filt: dict, sort: Sort | None, limit: int | None, projection: dict | None) -> list:
+    first, *rest = COLLECTIONS
+    pipeline = _branch(first, filt, sort, limit, projection)
+    for collection in rest:
+        pipeline.append({"$unionWith": {"coll": collection, "pipeline": _branch(collection, filt, sort, limit, projection)}})
+    # merge the branches' at most `limit` rows each
+    return pipeline + ([{"$sort": dict(sort)}] if sort else []) + ([{"$limit": limit}] if limit else [])
+
+
+@traced
+async def find_loan(loan_id: str, extra_filter: dict | None = None, projection: dict | None = None) -> tuple[str | None, dict | None]:
+    """Fetch a loan by numeric loan id or ObjectId string in exactly one query.
+
+    A loan whose collection is already known is read with a `find_one` on that collection;
+    otherwise both collections are searched by one `$unionWith` aggregation. Returns
+    `(collection, loan)` or `(None, None)`.
+    """
+    db = await get_db()
+    filt = loan_id_filter(loan_id)
+    loan_key = next(iter(filt.values()))
+    filt.update(extra_filter or {})
+    collection = collection_for(loan_key)
+    if collection:
+        loan = await db[collection].find_one(filt, projection)
+        return (collection, loan) if loan else (None, None)
+    docs = await db[COLLECTIONS[0]].aggregate(_union_pipeline(filt, None, 1, projection)).to_list(length=1)
+    if not docs:
+        return None, None
+    loan = docs[0]
+    collection = loan.pop("loan_collection")
+    remember(loan_key, collection)
+    return collection, loan
+
+
+@traced
+async def list_loans(filt: dict, sort: Sort | None = None, limit: int | None = 200, projection: dict | None = None) -> list[dict]:
+    """List loans from every loan collection in one aggregation, sorted and limited server side.
+
+    Each result carries a `loan_collection` field naming the collection it came from.
+    """
+    db = await get_db()
+    sort = sort or [("applied_at", -1), ("_id", -1)]
+    loans = await db[COLLECTIONS[0]].aggregate(_union_pipeline(filt, sort, limit, projection)).to_list(length=limit)
+    for loan in loans:
+        remember(_loan_key(loan), loan["loan_collection"])
+    return loans
+
+
+@traced
+async def aggregate_loans(filt: dict, stages: list) -> list[dict]:
+    """Run extra aggregation `stages` over the matching loans of every loan collection in one query."""
+    db = await get_db()
+    return await db[COLLECTIONS[0]].aggregate(_union_pipeline(filt, None, None, None) + stages).to_list(length=None)
+
+
+@traced
+async def page_loans(filt: dict, sort: Sort, cursor: str | None = None, limit: int | None = None, projection: dict | None = None) -> dict:
+    """One keyset page of `list_loans` as raw documents; routes return it through `MongoJSONResponse`.
+
+    A `projection` must keep `loan_id` and the sort keys (see `projection_for`).
+    """
+    limit = page_limit(limit)
+    loans = await list_loans(keyset_filter(filt, sort, cursor), sort, limit + 1, projection)
+    loans, next_cursor = split_page(loans, sort, limit)
+    return {"items": loans, "next_cursor": next_cursor}
@@ -1,13 +1,48 @@
 
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+from ..core.tracing import traced
 from ..utils.id import to_object_id, loan_id_filter
 from fastapi import HTTPException
 from ..database.mongo import get_db
 from ..utils.serializers import normalize_doc
 from ..models.enums import LoanStatus
-from ..utils.sequences import next_loan_id, next_transaction_id
+from ..utils.sequences import next_loan_id
 from ..utils.dates import next_month_date
+from ..utils.cibil import cibil_change_pipeline
+from .ledger_service import ledger_session, credit, debit, record_transaction
+from .loan_repository import find_loan, list_loans, page_loans, remember
+from .summary_service import refresh_summary_loans, summary_emi_paid, summary_set_balance
+from ..schemas.loan import LoanOut
+from ..utils.projections import projection_for
+
+
+def emi_paid_update(emi: float, next_emi_date: datetime) -> list:
+    """Update pipeline recording one paid EMI on a loan without reading it first."""
+    return [
+        {"$set": {
+            "remaining_tenure": {"$subtract": ["$remaining_tenure", 1]},
+            "remaining_amount": {"$subtract": ["$remaining_amount", emi]},
+            "total_paid": {"$add": [{"$ifNull": ["$total_paid", 0]}, emi]},
+            "next_emi_date": next_emi_date,
+        }},
+        {"$set": {"status": {"$cond": [{"$lte": ["$remaining_tenure", 0]}, LoanStatus.COMPLETED, LoanStatus.ACTIVE]}}},
+    ]
+
+
+def emi_reverted_update(emi: float, next_emi_date: datetime) -> list:
+    """Undo `emi_paid_update` on a loan whose EMI could not be debited after all."""
+    return [
+        {"$set": {
+            "remaining_tenure": {"$add": ["$remaining_tenure", 1]},
+            "remaining_amount": {"$add": ["$remaining_amount", emi]},
+            "total_paid": {"$subtract": ["$total_paid", emi]},
+            "next_emi_date": next_emi_date,
+            "status": LoanStatus.ACTIVE,
+        }},
+        {"$unset": "last_auto_debit"},
+    ]
 
 
 def compute_emi(amount: float, interest_rate: float, tenure_months: int) -> float:
@@ -27,20 +62,15 @@ def compute_emi(amount: float, interest_rate: float, tenure_months: int) -> floa
     emi = amount * r * (1 + r) ** n / denom
     return round(emi, 2)
 
-async def apply_loan(collection: str, customer_id: str, payload: dict, interest_rate: float):
-    db = await get_db()
-    # ensure KYC approved
-    kyc = await db.kyc_details.find_one({"customer_id": customer_id, "kyc_status": "approved"})
-    if not kyc:
-        raise HTTPException(status_code=400, detail="KYC not approved")
+def build_loan_doc(loan_seq: int, customer_id, payload: dict, interest_rate: float, cibil_score: int, now: datetime | None = None) -> dict:
+    """The new loan document for an application; pure, so it can be benchmarked without a database."""
     amount = float(payload["loan_amount"]) 
     tenure = int(payload["tenure_months"]) 
     if tenure <= 0:
         raise HTTPException(status_code=400, detail="tenure_months must be greater than 0")
     emi = compute_emi(amount, interest_rate, tenure)
-    # assign a simple incremental loan_id for easier references
-    loan_seq = await next_loan_id()
-    doc = {
+    now = now or datetime.utcnow()
+    return {
         **payload,
         "loan_id": loan_seq,
         "_id": loan_seq,
@@ -49,28 +79,43 @@ async def apply_loan(collection: str, customer_id: str, payload: dict, interest_
         "emi_per_month": emi,
         "remaining_amount": round(emi * tenure, 2),
         "total_paid": 0.0,
-        "cibil_score_at_apply": int(kyc.get("cibil_score", 0)),
+        "cibil_score_at_apply": int(cibil_score),
         "max_eligible_amount": float(payload.get("salary_income", 0)) * 60,  # simplistic
         "status": LoanStatus.APPLIED,
         "manager_id": None,
         "verification_id": None,
         "admin_id": None,
-        "next_emi_date": next_month_date(),
-        "applied_at": datetime.utcnow(),
+        "next_emi_date": next_month_date(now),
+        "applied_at": now,
         "approved_at": None,
         "disbursed_at": None,
     }
+
+
+@traced
+async def apply_loan(collection: str, customer_id: str, payload: dict, interest_rate: float):
+    db = await get_db()
+    # ensure KYC approved
+    kyc = await db.kyc_details.find_one({"customer_id": customer_id, "kyc_status": "approved"})
+    if not kyc:
+        raise HTTPException(status_code=400, detail="KYC not approved")
+    if int(payload["tenure_months"]) <= 0:
+        raise HTTPException(status_code=400, detail="tenure_months must be greater than 0")
+    # assign a simple incremental loan_id for easier references
+    loan_seq = await next_loan_id()
+    doc = build_loan_doc(loan_seq, customer_id, payload, interest_rate, kyc.get("cibil_score", 0))
     res = await db[collection].insert_one(doc)
+    remember(loan_seq, collection)
     out = {"_id": loan_seq, **doc}
     return normalize_doc(out)
 
+@traced
 async def list_manager_loans(manager_id: str):
-    db = await get_db()
-    loans = await db.personal_loans.find({}).to_list(length=200)
-    loans += await db.vehicle_loans.find({}).to_list(length=200)
+    loans = await list_loans({}, limit=400)
     loans = [normalize_doc(l) for l in loans]
     return loans
 
+@traced
 async def assign_verification(loan_collection: str, loan_id: str, verification_id: str):
     db = await get_db()
     filt = loan_id_filter(loan_id)
@@ -80,6 +125,7 @@ async def assign_verification(loan_collection: str, loan_id: str, verification_i
     await db[loan_collection].update_one(filt, {"$set": {"verification_id": verification_id, "status": LoanStatus.ASSIGNED_TO_VERIFICATION}})
     return True
 
+@traced
 async def verification_complete(loan_collection: str, loan_id: str, approved: bool):
     db = await get_db()
     filt = loan_id_filter(loan_id)
@@ -89,6 +135,7 @@ async def verification_complete(loan_collection: str, loan_id: str, approved: bo
     await db[loan_collection].update_one(filt, {"$set": {"status": LoanStatus.VERIFICATION_DONE if approved else LoanStatus.REJECTED}})
     return True
 
+@traced
 async def manager_approve_or_reject(loan_collection: str, loan_id: str, manager_id: str, approve: bool):
     db = await get_db()
     filt = loan_id_filter(loan_id)
@@ -101,11 +148,13 @@ async def manager_approve_or_reject(loan_collection: str, loan_id: str, manager_
     amount = float(loan["loan_amount"]) 
     if amount <= 1500000:
         await db[loan_collection].update_one(filt, {"$set": {"status": LoanStatus.MANAGER_APPROVED, "manager_id": manager_id, "approved_at": datetime.utcnow()}})
+        await refresh_summary_loans(loan["customer_id"])
     else:
         await db[loan_collection].update_one(filt, {"$set": {"status": LoanStatus.PENDING_ADMIN_APPROVAL, "manager_id": manager_id}})
     return True
 
 
+@traced
 async def admin_final_approve(loan_collection: str, loan_id: str, admin_id: str):
     db = await get_db()
     filt = loan_id_filter(loan_id)
@@ -119,47 +168,70 @@ async def admin_final_approve(loan_collection: str, loan_id: str, admin_id: str)
     if loan.get("status") != LoanStatus.PENDING_ADMIN_APPROVAL:
         raise HTTPException(status_code=400, detail="Loan not pending admin approval")
     await db[loan_collection].update_one(filt, {"$set": {"status": LoanStatus.ADMIN_APPROVED, "admin_id": admin_id, "approved_at": datetime.utcnow()}})
+    await refresh_summary_loans(loan["customer_id"])
     return True
 
+@traced
 async def send_sanction(loan_collection: str, loan_id: str):
     db = await get_db()
     filt = loan_id_filter(loan_id)
-    await db[loan_collection].update_one(filt, {"$set": {"status": LoanStatus.SANCTION_SENT}})
+    loan = await db[loan_collection].find_one_and_update(filt, {"$set": {"status": LoanStatus.SANCTION_SENT}}, {"customer_id": 1})
+    if loan:
+        await refresh_summary_loans(loan["customer_id"])
     return True
 
+@traced
 async def mark_signed_received(loan_collection: str, loan_id: str):
     db = await get_db()
     filt = loan_id_filter(loan_id)
-    await db[loan_collection].update_one(filt, {"$set": {"status": LoanStatus.SIGNED_RECEIVED}})
+    loan = await db[loan_collection].find_one_and_update(filt, {"$set": {"status": LoanStatus.SIGNED_RECEIVED}}, {"customer_id": 1})
+    if loan:
+        await refresh_summary_loans(loan["customer_id"])
     return True
 
+@traced
 async def disburse(loan_collection: str, loan_id: str):
     db = await get_db()
     filt = loan_id_filter(loan_id)
-    loan = await db[loan_collection].find_one(filt)
-    if not loan:
-        raise HTTPException(status_code=404, detail="Loan not found")
-    # credit to customer's bank account
-    acc = await db.bank_accounts.find_one({"customer_id": loan["customer_id"]})
-    new_balance = float(acc.get("balance", 0)) + float(loan["loan_amount"]) 
-    await db.bank_accounts.update_one({"_id": acc["_id"]}, {"$set": {"balance": new_balance}})
-    txn = {
-        "customer_id": loan["customer_id"],
-        "loan_id": loan.get("loan_id") or (int(loan["_id"]) if isinstance(loan.get("_id"), int) else str(loan["_id"])),
-        "loan_type": "personal" if loan_collection == "personal_loans" else "vehicle",
-        "type": "disbursement",
-        "amount": float(loan["loan_amount"]),
-        "balance_after": new_balance,
-        "created_at": datetime.utcnow(),
-    }
-    # use numeric transaction id
-    tid = await next_transaction_id()
-    txn["_id"] = tid
-    txn["transaction_id"] = tid
-    await db.transactions.insert_one(txn)
-    await db[loan_collection].update_one(filt, {"$set": {"status": LoanStatus.ACTIVE, "disbursed_at": datetime.utcnow()}})
+    async with ledger_session() as session:
+        # claim the loan before paying out: only one caller moves it out of signed_received
+        loan = await db[loan_collection].find_one_and_update(
+            {**filt, "status": LoanStatus.SIGNED_RECEIVED},
+            {"$set": {"status": LoanStatus.ACTIVE, "disbursed_at": datetime.utcnow()}},
+            session=session,
+        )
+        if not loan:
+            if not await db[loan_collection].count_documents(filt, limit=1, session=session):
+                raise HTTPException(status_code=404, detail="Loan not found")
+            raise HTTPException(status_code=400, detail="Loan is not awaiting disbursement")
+        # credit to customer's bank account
+        try:
+            acc = await credit(loan["customer_id"], float(loan["loan_amount"]), session=session)
+        except HTTPException:
+            if session is None:
+                # no transaction to abort: hand the loan back for a later attempt
+                await db[loan_collection].update_one(
+                    {**filt, "status": LoanStatus.ACTIVE},
+                    {"$set": {"status": LoanStatus.SIGNED_RECEIVED}, "$unset": {"disbursed_at": ""}},
+                )
+            raise
+        txn = {
+            "customer_id": loan["customer_id"],
+            "loan_id": loan.get("loan_id") or (int(loan["_id"]) if isinstance(loan.get("_id"), int) else str(loan["_id"])),
+            "loan_type": "personal" if loan_collection == "personal_loans" else "vehicle",
+            "type": "disbursement",
+            "amount": float(loan["loan_amount"]),
+            "balance_after": float(acc["balance"]),
+            "created_at": datetime.utcnow(),
+        }
+        await record_transaction(txn, session=session)
+        await summary_set_balance(loan["customer_id"], float(acc["balance"]), session=session)
+    # after the commit: the totals aggregate ($unionWith) cannot run inside a transaction and
+    # would otherwise read the loan as it was before this disbursement
+    await refresh_summary_loans(loan["customer_id"])
     return True
 
+@traced
 async def pay_emi(loan_collection: str, loan_id: str, customer_id: str):
     db = await get_db()
     filt = loan_id_filter(loan_id)
@@ -168,62 +240,71 @@ async def pay_emi(loan_collection: str, loan_id: str, customer_id: str):
     loan = await db[loan_collection].find_one(filt)
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
+    return await _pay_loan_emi(loan_collection, loan, customer_id)
+
+
+async def _pay_loan_emi(loan_collection: str, loan: dict, customer_id: str):
+    db = await get_db()
     if loan.get("status") != LoanStatus.ACTIVE:
         raise HTTPException(status_code=400, detail="Loan not active")
-    acc = await db.bank_accounts.find_one({"customer_id": customer_id})
+    # the status and tenure checks are part of the update, so concurrent payments cannot both count
+    filt = {"_id": loan["_id"], "customer_id": customer_id, "status": LoanStatus.ACTIVE, "remaining_tenure": {"$gt": 0}}
     emi = float(loan["emi_per_month"])
-    if float(acc.get("balance", 0)) < emi:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-    new_balance = float(acc.get("balance", 0)) - emi
-    await db.bank_accounts.update_one({"_id": acc["_id"]}, {"$set": {"balance": new_balance}})
-    # update loan
-    remaining_tenure = int(loan["remaining_tenure"]) - 1
-    remaining_amount = float(loan["remaining_amount"]) - emi
-    await db[loan_collection].update_one(
-        filt,
-        {"$set": {
-            "remaining_tenure": remaining_tenure,
-            "remaining_amount": remaining_amount,
-            "total_paid": float(loan.get("total_paid", 0)) + emi,
-            "next_emi_date": next_month_date(),
-            "status": LoanStatus.COMPLETED if remaining_tenure <= 0 else LoanStatus.ACTIVE
-        }}
-    )
-    txn = {
-        "customer_id": customer_id,
-        "loan_id": loan.get("loan_id") or (int(loan.get("_id")) if isinstance(loan.get("_id"), int) else str(loan.get("_id"))),
-        "loan_type": "personal" if loan_collection == "personal_loans" else "vehicle",
-        "type": "emi",
-        "amount": emi,
-        "balance_after": new_balance,
-        "created_at": datetime.utcnow(),
-    }
-    tid = await next_transaction_id()
-    txn["_id"] = tid
-    txn["transaction_id"] = tid
-    await db.transactions.insert_one(txn)
-    # KYC: increase cibil +1 max 850
-    kyc = await db.kyc_details.find_one({"customer_id": customer_id})
-    if kyc:
-        new_cibil = min(850, int(kyc.get("cibil_score", 0)) + 1)
-        await db.kyc_details.update_one({"_id": kyc["_id"]}, {"$set": {"cibil_score": new_cibil}})
+    async with ledger_session() as session:
+        before = await db[loan_collection].find_one_and_update(
+            filt, emi_paid_update(emi, next_month_date()), {"next_emi_date": 1, "remaining_tenure": 1},
+            return_document=ReturnDocument.BEFORE, session=session,
+        )
+        if not before:
+            raise HTTPException(status_code=400, detail="Loan not active")
+        try:
+            acc = await debit(customer_id, emi, session=session)
+        except HTTPException:
+            # a transaction rolls the loan back by itself; without one, put the EMI back
+            if session is None:
+                await db[loan_collection].update_one(
+                    {"_id": loan["_id"], "remaining_tenure": before["remaining_tenure"] - 1},
+                    emi_reverted_update(emi, before["next_emi_date"]),
+                )
+            raise
+        txn = {
+            "customer_id": customer_id,
+            "loan_id": loan.get("loan_id") or (int(loan.get("_id")) if isinstance(loan.get("_id"), int) else str(loan.get("_id"))),
+            "loan_type": "personal" if loan_collection == "personal_loans" else "vehicle",
+            "type": "emi",
+            "amount": emi,
+            "balance_after": float(acc["balance"]),
+            "created_at": datetime.utcnow(),
+        }
+        await record_transaction(txn, session=session)
+        # KYC: increase cibil +1 max 850
+        await db.kyc_details.update_one({"customer_id": customer_id}, cibil_change_pipeline(1), session=session)
+        completed = before["remaining_tenure"] <= 1
+        await summary_emi_paid(customer_id, float(acc["balance"]), emi, completed, session=session)
     return True
 
 
+@traced
 async def pay_emi_any(loan_id: str, customer_id: str):
-    # Try personal first
-    try:
-        await pay_emi('personal_loans', loan_id, customer_id)
-        return {"collection": "personal_loans"}
-    except Exception:
-        # try vehicle
-        await pay_emi('vehicle_loans', loan_id, customer_id)
-        return {"collection": "vehicle_loans"}
+    collection, loan = await find_loan(loan_id, {"customer_id": customer_id})
+    if not loan:
+        raise HTTPException(status_code=404, detail="Loan not found")
+    await _pay_loan_emi(collection, loan, customer_id)
+    return {"collection": collection}
+
+
+CUSTOMER_LOANS_SORT = [("applied_at", -1), ("_id", -1)]
+CUSTOMER_LOANS_FIELDS = projection_for(LoanOut, "loan_id", "next_emi_date", sort=CUSTOMER_LOANS_SORT)
+
+
+@traced
+async def list_customer_loans(customer_id: str, cursor: str | None = None, limit: int | None = None):
+    # newest first
+    return await page_loans({"customer_id": customer_id}, CUSTOMER_LOANS_SORT, cursor, limit, CUSTOMER_LOANS_FIELDS)
 
 
-async def list_customer_loans(customer_id: str):
+@traced
+async def attach_loan_document(collection: str, loan_oid, field: str, ref: str):
+    """Point a loan's document field at an uploaded blob."""
     db = await get_db()
-    loans = await db.personal_loans.find({"customer_id": customer_id}).to_list(length=200)
-    loans += await db.vehicle_loans.find({"customer_id": customer_id}).to_list(length=200)
-    from ..utils.serializers import normalize_doc
-    return [normalize_doc(l) for l in loans]
+    await db[collection].update_one({"_id": loan_oid}, {"$set": {field: ref}})
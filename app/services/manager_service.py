@@ -1,11 +1,24 @@
 
-from ..database.mongo import get_db
+from .loan_repository import page_loans
+from ..core.tracing import traced
 from ..models.enums import LoanStatus
-from ..utils.serializers import normalize_doc
+from ..schemas.loan import LoanOut
+from ..utils.projections import projection_for
 
+QUEUE_SORT = [("applied_at", 1), ("_id", 1)]
+QUEUE_FIELDS = projection_for(
+    LoanOut, "loan_id", "customer_id", "full_name", "loan_purpose", "salary_income",
+    "cibil_score_at_apply", "max_eligible_amount", "verification_id", sort=QUEUE_SORT,
+)
 
-async def get_loans_for_manager():
-    db = await get_db()
-    loans = await db.personal_loans.find({"status": {"$in": [LoanStatus.APPLIED, LoanStatus.VERIFICATION_DONE, LoanStatus.PENDING_ADMIN_APPROVAL]}}).to_list(length=200)
-    loans += await db.vehicle_loans.find({"status": {"$in": [LoanStatus.APPLIED, LoanStatus.VERIFICATION_DONE, LoanStatus.PENDING_ADMIN_APPROVAL]}}).to_list(length=200)
-    return [normalize_doc(l) for l in loans]
+
+@traced
+async def get_loans_for_manager(cursor: str | None = None, limit: int | None = None):
+    # work queue: oldest application first
+    return await page_loans(
+        {"status": {"$in": [LoanStatus.APPLIED, LoanStatus.VERIFICATION_DONE, LoanStatus.PENDING_ADMIN_APPROVAL]}},
+        QUEUE_SORT,
+        cursor,
+        limit,
+        QUEUE_FIELDS,
+    )
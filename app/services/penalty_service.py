@@ -0,0 +1,159 @@
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from ..core.config import settings
+from ..core.tracing import traced
+from ..database.mongo import get_db
+from ..models.enums import LoanCollection, LoanStatus
+from ..utils.batching import iter_batches
+from ..utils.pagination import keyset_after
+from ..utils.cibil import cibil_change_pipeline
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_ID = "emi_penalty_scan"
+# matches the status+next_emi_date+_id index, so the scan never sorts in memory
+SCAN_SORT = [("next_emi_date", 1), ("_id", 1)]
+
+# CIBIL -5 with a floor of 300, evaluated server side so no kyc read is needed
+CIBIL_PENALTY_PIPELINE = cibil_change_pipeline(-5)
+
+
+def _write_error_count(exc: BulkWriteError) -> int:
+    return len(exc.details.get("writeErrors", []))
+
+
+async def _penalize_batch(db, coll_name: str, loans: list, as_of: datetime) -> tuple[int, int]:
+    """Apply one batch: bump next_emi_date on the loans, then decrement CIBIL per loan bumped.
+
+    Each loan update is conditional and stamps a tag unique to this batch, and only the loans read
+    back with that tag are penalized, so a loan paid, closed or already bumped in the
+    meantime costs the customer nothing. Returns (penalized, skipped); every loan counts once.
+    """
+    loans_with_customer = [l for l in loans if l.get("customer_id") is not None]
+    if not loans_with_customer:
+        return 0, len(loans)
+
+    tag = ObjectId()
+    # push due to next cycle to avoid repeated penalty until next scan
+    loan_ops = [
+        UpdateOne(
+            {"_id": l["_id"], "status": LoanStatus.ACTIVE, "next_emi_date": {"$lt": as_of}},
+            {"$set": {"next_emi_date": as_of, "last_penalty": tag}},
+        )
+        for l in loans_with_customer
+    ]
+    try:
+        await db[coll_name].bulk_write(loan_ops, ordered=False)
+    except BulkWriteError:
+        pass  # loans whose update failed are not read back below, so they are skipped
+    bumped = await db[coll_name].find(
+        {"_id": {"$in": [l["_id"] for l in loans_with_customer]}, "last_penalty": tag}, {"customer_id": 1}
+    ).to_list(length=None)
+    if not bumped:
+        return 0, len(loans)
+
+    kyc_failed = 0
+    try:
+        await db.kyc_details.bulk_write(
+            [UpdateOne({"customer_id": l["customer_id"]}, CIBIL_PENALTY_PIPELINE) for l in bumped], ordered=False
+        )
+    except BulkWriteError as exc:
+        kyc_failed = _write_error_count(exc)
+    # mirror the penalty on the materialized profile summary; drift is repaired by its rebuild job
+    try:
+        await db.customer_summary.bulk_write(
+            [UpdateOne({"_id": l["customer_id"]}, CIBIL_PENALTY_PIPELINE) for l in bumped], ordered=False
+        )
+    except BulkWriteError as exc:
+        logger.warning("customer_summary penalty mirror failed for %d loans", _write_error_count(exc))
+    penalized = len(bumped) - kyc_failed
+    return penalized, len(loans) - penalized
+
+
+async def _load_checkpoint(db, resume: bool) -> dict:
+    checkpoint = await db.job_checkpoints.find_one({"_id": CHECKPOINT_ID}) if resume else None
+    if checkpoint and not checkpoint.get("completed"):
+        checkpoint["resumed"] = True
+        return checkpoint
+    checkpoint = {
+        "_id": CHECKPOINT_ID,
+        "as_of": datetime.utcnow(),
+        "positions": {},
+        "completed": False,
+        "started_at": datetime.utcnow(),
+    }
+    await db.job_checkpoints.replace_one({"_id": CHECKPOINT_ID}, checkpoint, upsert=True)
+    checkpoint["resumed"] = False
+    return checkpoint
+
+
+@traced
+async def run_penalty_scan(batch_size: int | None = None, concurrency: int | None = None, resume: bool = True) -> dict:
+    """Penalize CIBIL for ACTIVE loans whose next_emi_date is before the scan's `as_of` time.
+
+    Overdue loans are streamed from every loan collection in due-date order and written back with
+    unordered `bulk_write` calls; up to `concurrency` batches are flushed at once. After each
+    window of batches the last loan's sort key is saved in `job_checkpoints`, so an interrupted
+    scan resumes from there with the same `as_of`. The loan bump is written before the CIBIL decrement, so a
+    crash mid-window can miss a penalty for that window but never applies one twice.
+    """
+    db = await get_db()
+    batch_size = batch_size or settings.PENALTY_SCAN_BATCH_SIZE
+    concurrency = max(1, concurrency or settings.PENALTY_SCAN_CONCURRENCY)
+    checkpoint = await _load_checkpoint(db, resume)
+    as_of = checkpoint["as_of"]
+    positions = checkpoint["positions"]
+
+    started = time.perf_counter()
+    totals = {"scanned": 0, "penalized": 0, "skipped": 0}
+
+    async def flush(coll_name: str, window: list):
+        results = await asyncio.gather(*[_penalize_batch(db, coll_name, b, as_of) for b in window])
+        totals["scanned"] += sum(len(b) for b in window)
+        totals["penalized"] += sum(r[0] for r in results)
+        totals["skipped"] += sum(r[1] for r in results)
+        await db.job_checkpoints.update_one(
+            {"_id": CHECKPOINT_ID},
+            {"$set": {f"positions.{coll_name}.after": [window[-1][-1]["next_emi_date"], window[-1][-1]["_id"]]}},
+        )
+
+    for coll_name in [c.value for c in LoanCollection]:
+        position = positions.get(coll_name, {})
+        if position.get("done"):
+            continue
+        filt = {"status": LoanStatus.ACTIVE, "next_emi_date": {"$lt": as_of}}
+        if position.get("after"):
+            filt = keyset_after(filt, SCAN_SORT, position["after"])
+        cursor = db[coll_name].find(filt, {"customer_id": 1, "next_emi_date": 1}, batch_size=batch_size).sort(SCAN_SORT)
+
+        window = []
+        async for batch in iter_batches(cursor, batch_size):
+            window.append(batch)
+            if len(window) >= concurrency:
+                await flush(coll_name, window)
+                window = []
+        if window:
+            await flush(coll_name, window)
+        await db.job_checkpoints.update_one({"_id": CHECKPOINT_ID}, {"$set": {f"positions.{coll_name}.done": True}})
+
+    await db.job_checkpoints.update_one(
+        {"_id": CHECKPOINT_ID},
+        {"$set": {"completed": True, "completed_at": datetime.utcnow()}},
+    )
+    elapsed = time.perf_counter() - started
+    scanned = totals["scanned"]
+    return {
+        "penalized": totals["penalized"],
+        "scanned": scanned,
+        "skipped": totals["skipped"],
+        "resumed": checkpoint["resumed"],
+        "as_of": as_of,
+        "elapsed_seconds": round(elapsed, 3),
+        "loans_per_sec": round(scanned / elapsed, 1) if elapsed > 0 else 0.0,
+    }
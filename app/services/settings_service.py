@@ -1,8 +1,27 @@
 
+import asyncio
+import logging
 from datetime import datetime
+from types import MappingProxyType
+from ..core import diagnostics, profiling
+from ..core.config import settings as app_settings
+from ..core.tracing import traced
 from ..database.mongo import get_db
 
-async def get_settings():
+logger = logging.getLogger(__name__)
+
+# Immutable copy of the system_settings document. Every update bumps its `version`, and each
+# worker polls just that field, so readers never wait on I/O and see new values within
+# SETTINGS_POLL_SECONDS.
+_snapshot: MappingProxyType | None = None
+
+
+def _version(doc) -> int:
+    return int(doc.get("version") or 0) if doc else -1
+
+
+async def _load_settings() -> MappingProxyType:
+    global _snapshot
     db = await get_db()
     s = await db.system_settings.find_one({})
     if not s:
@@ -12,14 +31,50 @@ async def get_settings():
             "min_cibil_required": 650,
             "updated_by": None,
             "updated_at": datetime.utcnow(),
+            "version": 1,
         }
         await db.system_settings.insert_one(s)
     # stringify _id if present to avoid ObjectId serialization errors
     if s and "_id" in s:
         s["_id"] = str(s["_id"])
-    return s
+    s["version"] = _version(s)
+    _snapshot = MappingProxyType(s)
+    diagnostics.configure(s.get("diagnostics"))
+    profiling.configure(s.get("profiling"))
+    return _snapshot
+
+
+async def get_settings() -> MappingProxyType:
+    """Current settings snapshot; only the first call in a process touches the database."""
+    return _snapshot if _snapshot is not None else await _load_settings()
+
+
+@traced
+async def refresh_settings() -> bool:
+    """Reload the snapshot if another worker changed it. Returns True when it was reloaded."""
+    db = await get_db()
+    doc = await db.system_settings.find_one({}, {"version": 1})
+    if _snapshot is not None and _version(doc) == _snapshot["version"]:
+        return False
+    await _load_settings()
+    return True
+
+
+async def poll_settings():
+    while True:
+        await asyncio.sleep(app_settings.SETTINGS_POLL_SECONDS)
+        try:
+            await refresh_settings()
+        except Exception:
+            logger.exception("settings version poll failed; keeping version %s", _version(_snapshot))
+
 
+@traced
 async def update_settings(admin_id: str, payload: dict):
     db = await get_db()
-    await db.system_settings.update_one({}, {"$set": {**payload, "updated_by": admin_id, "updated_at": datetime.utcnow()}}, upsert=True)
-    return await get_settings()
+    await db.system_settings.update_one(
+        {},
+        {"$set": {**payload, "updated_by": admin_id, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}},
+        upsert=True,
+    )
+    return dict(await _load_settings())
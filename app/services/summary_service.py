@@ -0,0 +1,154 @@
+"""Materialized `customer_summary` documents backing the customer profile dashboard.
+
+One document per customer (`_id` = customer_id) holds everything `/customer/get/profile` shows.
+Write paths keep it current with in-place updates; they never create it, so a customer with
+no summary yet simply gets one built on their next profile read. `rebuild_customer_summaries`
+recomputes every document from the source collections to repair any drift.
+"""
+import asyncio
+from datetime import datetime
+from pymongo import ReplaceOne
+from ..core.tracing import traced
+from ..database.mongo import get_db
+from ..models.enums import LoanStatus, Roles
+from ..utils.batching import iter_batches
+from ..utils.cibil import cibil_change_expr
+from .loan_repository import aggregate_loans
+
+ACTIVE_LOAN_STATUSES = [LoanStatus.ACTIVE, LoanStatus.ADMIN_APPROVED, LoanStatus.MANAGER_APPROVED]
+SUMMARY_FIELDS = [
+    "name", "email", "account_number", "ifsc", "balance", "cibil_score", "kyc_status",
+    "active_loans", "remaining_tenure", "remaining_amount",
+]
+
+
+async def _loan_totals(customer_ids: list) -> dict:
+    rows = await aggregate_loans(
+        {"customer_id": {"$in": customer_ids}, "status": {"$in": ACTIVE_LOAN_STATUSES}},
+        [{"$group": {
+            "_id": "$customer_id",
+            "active_loans": {"$sum": 1},
+            "remaining_tenure": {"$sum": {"$toInt": {"$ifNull": ["$remaining_tenure", 0]}}},
+            "remaining_amount": {"$sum": {"$toDouble": {"$ifNull": ["$remaining_amount", 0]}}},
+        }}],
+    )
+    return {r["_id"]: r for r in rows}
+
+
+def _summary_doc(customer_id, user, acc, kyc, totals) -> dict:
+    totals = totals or {}
+    return {
+        "_id": customer_id,
+        "name": user.get("full_name") if user else None,
+        "email": user.get("email") if user else None,
+        "account_number": acc.get("account_number") if acc else None,
+        "ifsc": acc.get("ifsc_code") if acc else None,
+        "balance": acc.get("balance") if acc else 0.0,
+        "cibil_score": kyc.get("cibil_score") if kyc else None,
+        "kyc_status": kyc.get("kyc_status") if kyc else "not_submitted",
+        "active_loans": totals.get("active_loans", 0),
+        "remaining_tenure": totals.get("remaining_tenure", 0),
+        "remaining_amount": totals.get("remaining_amount", 0.0),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+@traced
+async def build_customer_summary(customer_id) -> dict:
+    """Cold path: compute the summary from the source collections concurrently and store it."""
+    db = await get_db()
+    user, acc, kyc, totals = await asyncio.gather(
+        db.users.find_one({"customer_id": customer_id}, {"full_name": 1, "email": 1}),
+        db.bank_accounts.find_one({"customer_id": customer_id}, {"account_number": 1, "ifsc_code": 1, "balance": 1}),
+        db.kyc_details.find_one({"customer_id": customer_id}, {"cibil_score": 1, "kyc_status": 1}),
+        _loan_totals([customer_id]),
+    )
+    doc = _summary_doc(customer_id, user, acc, kyc, totals.get(customer_id))
+    await db.customer_summary.replace_one({"_id": customer_id}, doc, upsert=True)
+    return doc
+
+
+@traced
+async def get_customer_summary(customer_id) -> dict:
+    db = await get_db()
+    doc = await db.customer_summary.find_one({"_id": customer_id})
+    if not doc:
+        doc = await build_customer_summary(customer_id)
+    return {k: doc.get(k) for k in SUMMARY_FIELDS}
+
+
+@traced
+async def summary_set_balance(customer_id, balance: float, session=None):
+    db = await get_db()
+    await db.customer_summary.update_one(
+        {"_id": customer_id}, {"$set": {"balance": balance, "updated_at": datetime.utcnow()}}, session=session
+    )
+
+
+def emi_paid_summary_update(balance: float, emis: int, amount: float, completed: int) -> list:
+    """Update pipeline for `emis` EMIs totalling `amount` paid, `completed` of which closed their loan."""
+    return [{"$set": {
+        "balance": balance,
+        "remaining_tenure": {"$subtract": ["$remaining_tenure", emis]},
+        "remaining_amount": {"$subtract": ["$remaining_amount", amount]},
+        "active_loans": {"$subtract": ["$active_loans", completed]},
+        "cibil_score": cibil_change_expr(emis),
+        "updated_at": "$$NOW",
+    }}]
+
+
+@traced
+async def summary_emi_paid(customer_id, balance: float, emi: float, completed: bool, session=None):
+    db = await get_db()
+    await db.customer_summary.update_one(
+        {"_id": customer_id}, emi_paid_summary_update(balance, 1, emi, int(completed)), session=session
+    )
+
+
+@traced
+async def summary_kyc_changed(customer_id, kyc_status: str, cibil_score: int | None):
+    db = await get_db()
+    await db.customer_summary.update_one(
+        {"_id": customer_id},
+        {"$set": {"kyc_status": kyc_status, "cibil_score": cibil_score, "updated_at": datetime.utcnow()}},
+    )
+
+
+@traced
+async def refresh_summary_loans(customer_id):
+    """Recompute the loan totals after a loan enters or leaves an active status."""
+    db = await get_db()
+    totals = (await _loan_totals([customer_id])).get(customer_id, {})
+    await db.customer_summary.update_one(
+        {"_id": customer_id},
+        {"$set": {
+            "active_loans": totals.get("active_loans", 0),
+            "remaining_tenure": totals.get("remaining_tenure", 0),
+            "remaining_amount": totals.get("remaining_amount", 0.0),
+            "updated_at": datetime.utcnow(),
+        }},
+    )
+
+
+@traced
+async def rebuild_customer_summaries(batch_size: int = 500) -> dict:
+    """Recompute every customer's summary from the source collections, a batch of customers at a time."""
+    db = await get_db()
+    rebuilt = 0
+    cursor = db.users.find({"role": Roles.CUSTOMER}, {"customer_id": 1, "full_name": 1, "email": 1}, batch_size=batch_size)
+    async for users in iter_batches(cursor, batch_size):
+        ids = [u.get("customer_id", u["_id"]) for u in users]
+        accounts, kycs, totals = await asyncio.gather(
+            db.bank_accounts.find({"customer_id": {"$in": ids}}, {"customer_id": 1, "account_number": 1, "ifsc_code": 1, "balance": 1}).to_list(length=None),
+            db.kyc_details.find({"customer_id": {"$in": ids}}, {"customer_id": 1, "cibil_score": 1, "kyc_status": 1}).to_list(length=None),
+            _loan_totals(ids),
+        )
+        accounts = {a["customer_id"]: a for a in accounts}
+        kycs = {k["customer_id"]: k for k in kycs}
+        ops = [
+            ReplaceOne({"_id": cid}, _summary_doc(cid, u, accounts.get(cid), kycs.get(cid), totals.get(cid)), upsert=True)
+            for cid, u in zip(ids, users)
+        ]
+        await db.customer_summary.bulk_write(ops, ordered=False)
+        rebuilt += len(ops)
+    return {"rebuilt": rebuilt}
@@ -1,18 +1,71 @@
 
+import csv
+import io
+from datetime import datetime
+from ..core.config import settings
+from ..core.tracing import traced
 from ..database.mongo import get_db
+from ..schemas.transactions import TransactionOut
+from ..utils.pagination import keyset_filter, page_limit, split_page
+from ..utils.projections import projection_for
+from ..utils.responses import dumps
 
-async def list_transactions(customer_id: str):
+TXN_SORT = [("created_at", -1), ("_id", -1)]
+STATEMENT_FIELDS = ["id", "loan_id", "loan_type", "type", "amount", "balance_after", "created_at"]
+TXN_FIELDS = projection_for(TransactionOut, sort=TXN_SORT)
+
+
+def _txn_row(t: dict) -> dict:
+    return {
+        "id": str(t["_id"]),
+        "loan_id": t.get("loan_id"),
+        "loan_type": t.get("loan_type"),
+        "type": t.get("type"),
+        "amount": float(t.get("amount", 0)),
+        "balance_after": float(t.get("balance_after", 0)),
+        "created_at": t.get("created_at").isoformat(),
+    }
+
+
+@traced
+async def list_transactions(customer_id: str, cursor: str | None = None, limit: int | None = None):
     db = await get_db()
-    txns = await db.transactions.find({"customer_id": customer_id}).sort("created_at", -1).to_list(length=200)
-    out = []
-    for t in txns:
-        out.append({
-            "id": str(t["_id"]),
-            "loan_id": t.get("loan_id"),
-            "loan_type": t.get("loan_type"),
-            "type": t.get("type"),
-            "amount": float(t.get("amount", 0)),
-            "balance_after": float(t.get("balance_after", 0)),
-            "created_at": t.get("created_at").isoformat(),
-        })
-    return out
+    limit = page_limit(limit)
+    filt = keyset_filter({"customer_id": customer_id}, TXN_SORT, cursor)
+    txns = await db.transactions.find(filt, TXN_FIELDS).sort(TXN_SORT).limit(limit + 1).to_list(length=limit + 1)
+    txns, next_cursor = split_page(txns, TXN_SORT, limit)
+    return {"items": [_txn_row(t) for t in txns], "next_cursor": next_cursor}
+
+
+def _encode_rows(rows: list[dict], fmt: str) -> bytes:
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.DictWriter(buf, fieldnames=STATEMENT_FIELDS).writerows(rows)
+        return buf.getvalue().encode()
+    return b"".join(dumps(r) + b"\n" for r in rows)
+
+
+async def iter_statement(customer_id, fmt: str = "ndjson", start: datetime | None = None, end: datetime | None = None):
+    """Yield a customer's transactions in [start, end) oldest first, encoded as NDJSON or CSV.
+
+    Rows are read with a batched cursor and emitted one cursor batch per chunk, so memory stays
+    bounded by EXPORT_BATCH_SIZE however long the history is.
+    """
+    db = await get_db()
+    filt = {"customer_id": customer_id}
+    if start or end:
+        filt["created_at"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+    batch_size = settings.EXPORT_BATCH_SIZE
+    cursor = db.transactions.find(filt, TXN_FIELDS, batch_size=batch_size)
+    cursor = cursor.sort([("created_at", 1), ("_id", 1)])
+
+    if fmt == "csv":
+        yield (",".join(STATEMENT_FIELDS) + "\r\n").encode()
+    rows = []
+    async for t in cursor:
+        rows.append(_txn_row(t))
+        if len(rows) >= batch_size:
+            yield _encode_rows(rows, fmt)
+            rows = []
+    if rows:
+        yield _encode_rows(rows, fmt)
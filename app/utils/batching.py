@@ -0,0 +1,11 @@
+
+async def iter_batches(cursor, size: int):
+    """Group documents from an async cursor into lists of at most `size`."""
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,11 @@
+
+
+def cibil_change_expr(delta: int) -> dict:
+    """Aggregation expression moving cibil_score by `delta`: rewards cap at 850, penalties floor at 300."""
+    moved = {"$add": [{"$ifNull": ["$cibil_score", 0]}, delta]}
+    return {"$min": [850, moved]} if delta >= 0 else {"$max": [300, moved]}
+
+
+def cibil_change_pipeline(delta: int) -> list:
+    """Update pipeline applying `cibil_change_expr` server side, so no read is needed."""
+    return [{"$set": {"cibil_score": cibil_change_expr(delta)}}]
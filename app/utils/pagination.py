@@ -0,0 +1,56 @@
+"""Keyset (cursor) pagination helpers.
+
+A page is fetched with the list's sort keys, e.g. `[("created_at", -1), ("_id", -1)]`, where the
+last key must be unique. The continuation token is the sort-key values of the last row returned,
+JSON-encoded with bson's extended JSON and base64'd, so clients treat it as opaque. Resuming
+from it is an index seek, so page N costs the same as page 1.
+"""
+import base64
+from bson import json_util
+from fastapi import HTTPException
+from ..core.config import settings
+
+Sort = list[tuple[str, int]]
+
+
+def page_limit(limit: int | None) -> int:
+    return max(1, min(limit or settings.PAGE_SIZE_DEFAULT, settings.PAGE_SIZE_MAX))
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+def decode_cursor(token: str, sort: Sort) -> list:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def keyset_filter(filt: dict, sort: Sort, cursor: str | None) -> dict:
+    """Narrow `filt` to the rows that come after `cursor` in `sort` order."""
+    if not cursor:
+        return filt
+    return keyset_after(filt, sort, decode_cursor(cursor, sort))
+
+
+def keyset_after(filt: dict, sort: Sort, after: list) -> dict:
+    """Narrow `filt` to the rows that come after the sort-key values `after`."""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: v for (f, _), v in zip(sort[:i], after[:i])}
+        clause[field] = {"$gt" if direction > 0 else "$lt": after[i]}
+        clauses.append(clause)
+    return {"$and": [filt, {"$or": clauses}]} if filt else {"$or": clauses}
+
+
+def split_page(docs: list, sort: Sort, limit: int) -> tuple[list, str | None]:
+    """Split `limit + 1` fetched rows into the page and the token for the next one."""
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor([docs[-1].get(field) for field, _ in sort])
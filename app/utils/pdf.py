@@ -0,0 +1,50 @@
+"""Structural PDF checks without a PDF library.
+
+`inspect_pdf` runs in a worker process (see services/document_service.py); it memory-maps the
+file, so even large uploads are scanned without being read into memory. It checks the header,
+that the last `startxref` points at a cross-reference table or stream, that the document is
+not encrypted, and the page count. Page counts come from the page-tree `/Count` entries, or
+from counting page objects; when both live inside compressed object streams the count is
+unknown (`pages` is None) and the file is accepted on structure alone.
+"""
+import mmap
+import re
+
+HEADER = re.compile(rb"%PDF-[12]\.\d")
+STARTXREF = re.compile(rb"startxref\s+(\d+)\s+%%EOF")
+XREF_AT = re.compile(rb"\s*(xref|\d+\s+\d+\s+obj)")
+ENCRYPT = re.compile(rb"/Encrypt\b")
+PAGES_COUNT = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b")
+PAGE = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+
+
+def _result(ok: bool, reason: str | None = None, pages: int | None = None) -> dict:
+    return {"ok": ok, "reason": reason, "pages": pages}
+
+
+def _inspect(m, max_pages: int) -> dict:
+    size = len(m)
+    if not HEADER.search(m, 0, 1024):
+        return _result(False, "not a PDF file")
+    trailers = list(STARTXREF.finditer(m, max(0, size - 2048)))
+    if not trailers:
+        return _result(False, "missing startxref/%%EOF trailer")
+    offset = int(trailers[-1].group(1))
+    if offset >= size or not XREF_AT.match(m, offset):
+        return _result(False, "broken cross-reference offset")
+    if ENCRYPT.search(m):
+        return _result(False, "encrypted PDF")
+    counts = [int(a or b) for a, b in PAGES_COUNT.findall(m)]
+    pages = max(counts) if counts else sum(1 for _ in PAGE.finditer(m)) or None
+    if pages is not None and pages > max_pages:
+        return _result(False, f"too many pages ({pages} > {max_pages})", pages)
+    return _result(True, pages=pages)
+
+
+def inspect_pdf(path: str, max_pages: int) -> dict:
+    """Return {"ok", "reason", "pages"} for the PDF at `path`."""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return _inspect(m, max_pages)
+    except (OSError, ValueError) as e:
+        return _result(False, f"unreadable file: {e}")
@@ -0,0 +1,23 @@
+"""Mongo projections derived from response schemas.
+
+List endpoints read only the fields they return: the projection is built from the response
+model's fields (by alias, so `LoanOut.id` reads `_id`), plus any extra fields the endpoint
+shows and the sort keys its cursor needs. Fields that are not projected never leave the
+server, which also keeps sensitive KYC fields (Aadhaar/PAN numbers) out of list responses.
+"""
+from typing import Type
+from pydantic import BaseModel
+from .pagination import Sort
+
+
+def model_fields(model: Type[BaseModel]) -> set[str]:
+    # `id` without an alias is filled from `_id`, which Mongo returns unless excluded
+    return {"_id" if f.alias == "id" else f.alias for f in model.__fields__.values()}
+
+
+def projection_for(model: Type[BaseModel] | None = None, *fields: str, sort: Sort | None = None) -> dict:
+    """Inclusion projection for `model`'s fields, the extra `fields` and the keys of `sort`."""
+    names = model_fields(model) if model else set()
+    names.update(fields)
+    names.update(field for field, _ in sort or [])
+    return {name: 1 for name in sorted(names)}
@@ -0,0 +1,34 @@
+from datetime import date
+from decimal import Decimal
+from typing import Any
+import orjson
+from bson import Decimal128, ObjectId
+from fastapi.responses import JSONResponse
+
+
+def _default(v: Any) -> Any:
+    # orjson already handles datetime/date, dicts with non-str keys (via the option) and dataclasses
+    if isinstance(v, ObjectId):
+        return str(v)
+    if isinstance(v, Decimal128):
+        return float(v.to_decimal())
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, date):
+        return v.isoformat()
+    raise TypeError(f"Object of type {type(v).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """JSON response that encodes raw Mongo documents (ObjectId, datetime, Decimal128) in one pass.
+
+    Routes returning large lists hand their raw documents to it directly, which skips both
+    `normalize_doc` and FastAPI's `jsonable_encoder`.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,46 +1,84 @@
+"""Numeric id sequences backed by the `counters` collection.
 
+Ids are handed out with a hi/lo scheme: a process reserves a block of ids with a single `$inc`
+on the counter document and then serves them from memory until the block is used up. Block
+reservation is atomic on the server, so any number of uvicorn workers (or batch scripts) can
+allocate concurrently without ever receiving the same id.
+
+Trade-offs of a block size greater than 1:
+- ids are unique but not contiguous and not ordered by creation time across workers;
+- when a process exits or crashes, the unused rest of its blocks is never handed out, so each
+  restart can leave a gap of up to `block size - 1` ids per sequence. Nothing reuses them.
+
+Block sizes come from `SEQUENCE_BLOCK_SIZES` (per sequence) with `SEQUENCE_BLOCK_SIZE` as the
+default; set a sequence to 1 to get the old one-round-trip-per-id behaviour.
+"""
+import asyncio
+import os
 from pymongo import ReturnDocument
+from ..core.config import settings
+from ..core.tracing import traced
 from ..database.mongo import get_db
 
-async def next_account_number() -> int:
+# sequence name -> [next id, last id, owning pid]
+_blocks: dict[str, list[int]] = {}
+_locks: dict[str, asyncio.Lock] = {}
+
+
+def block_size(name: str) -> int:
+    return max(1, int(settings.SEQUENCE_BLOCK_SIZES.get(name, settings.SEQUENCE_BLOCK_SIZE)))
+
+
+def _take(name: str) -> int | None:
+    block = _blocks.get(name)
+    # a forked child must not reuse the parent's block
+    if block and block[0] <= block[1] and block[2] == os.getpid():
+        block[0] += 1
+        return block[0] - 1
+    return None
+
+
+@traced
+async def next_id(name: str) -> int:
+    value = _take(name)
+    if value is not None:
+        return value
+    lock = _locks.setdefault(name, asyncio.Lock())
+    async with lock:
+        # another coroutine may have refilled the block while we waited
+        value = _take(name)
+        if value is not None:
+            return value
+        size = block_size(name)
+        first = await reserve_sequence(name, size)
+        _blocks[name] = [first + 1, first + size - 1, os.getpid()]
+        return first
+
+
+@traced
+async def reserve_sequence(name: str, count: int) -> int:
+    """Reserve `count` consecutive ids from counter `name` with one $inc and return the first."""
     db = await get_db()
     doc = await db.counters.find_one_and_update(
-        {"_id": "account_number"},
-        {"$inc": {"seq": 1}},
+        {"_id": name},
+        {"$inc": {"seq": count}},
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
-    return int(doc["seq"])  # starts at 1000000001 after first increment
+    return int(doc["seq"]) - count + 1
+
+
+async def next_account_number() -> int:
+    return await next_id("account_number")  # starts at 1000000001 after first increment
 
 
 async def next_customer_id() -> int:
-    db = await get_db()
-    doc = await db.counters.find_one_and_update(
-        {"_id": "customer_id"},
-        {"$inc": {"seq": 1}},
-        upsert=True,
-        return_document=ReturnDocument.AFTER,
-    )
-    return int(doc["seq"])  # starts at 1
+    return await next_id("customer_id")  # starts at 1
 
 
 async def next_loan_id() -> int:
-    db = await get_db()
-    doc = await db.counters.find_one_and_update(
-        {"_id": "loan_id"},
-        {"$inc": {"seq": 1}},
-        upsert=True,
-        return_document=ReturnDocument.AFTER,
-    )
-    return int(doc["seq"])  # starts at 1
+    return await next_id("loan_id")  # starts at 1
 
 
 async def next_transaction_id() -> int:
-    db = await get_db()
-    doc = await db.counters.find_one_and_update(
-        {"_id": "transaction_id"},
-        {"$inc": {"seq": 1}},
-        upsert=True,
-        return_document=ReturnDocument.AFTER,
-    )
-    return int(doc["seq"])  # starts at 1
+    return await next_id("transaction_id")  # starts at 1
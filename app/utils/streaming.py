@@ -0,0 +1,11 @@
+import zlib
+
+
+async def gzip_stream(chunks):
+    """Gzip an async byte stream chunk by chunk, without buffering the whole body."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    async for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()